@@ -0,0 +1,222 @@
+import errno
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from face_store import FaceStore
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MANIFEST_NAME = 'manifest.json'
+
+# How files are placed in category folders: 'hardlink' adds a directory
+# entry for the same file (same file system only), 'reflink' shares the
+# data blocks copy-on-write (Btrfs, XFS, ...), 'symlink' points at the
+# original and 'copy' copies the bytes. Unsupported modes fall back to copy.
+LINK_MODES = ('hardlink', 'reflink', 'symlink', 'copy')
+
+# Linux ioctl that clones a file's extents (_IOW(0x94, 9, int))
+FICLONE = getattr(fcntl, 'FICLONE', 0x40049409)
+
+# Threads creating links / copying files
+THREADS = 8
+
+def build_manifest(faces, labels, face_dir):
+    """
+    Return the category manifest of a clustering.
+
+    Args:
+        faces (list): Crop file paths or face store records, one per label
+        labels: Category ID of each face (-1 = noise, left out)
+        face_dir (str): Crop directory or face store the faces come from
+
+    Returns:
+        dict: {'face_dir', 'store', 'categories': {id: [{'crop', 'path',
+        'source'}]}}; 'path' is the crop file (None in a store) and
+        'source' the original image when it is known
+    """
+    categories = {}
+    for face, label in zip(faces, labels):
+        if label == -1:
+            continue
+        if isinstance(face, dict):
+            entry = {'crop': face['name'], 'path': None, 'source': face.get('source')}
+        else:
+            entry = {'crop': Path(face).name, 'path': str(face), 'source': None}
+        categories.setdefault(str(int(label)), []).append(entry)
+    return {'face_dir': str(face_dir), 'store': any(isinstance(face, dict) for face in faces),
+            'categories': dict(sorted(categories.items(), key=lambda item: int(item[0])))}
+
+def write_manifest(manifest, category_dir):
+    """Write manifest as category_dir/manifest.json; returns its path."""
+    Path(category_dir).mkdir(parents=True, exist_ok=True)
+    path = os.path.join(category_dir, MANIFEST_NAME)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return path
+
+def read_manifest(category_dir):
+    """Return the manifest of category_dir, or None when it has none."""
+    path = os.path.join(category_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _reflink(source, destination):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks need fcntl")
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(destination)
+            raise
+
+def link_file(source, destination, link='hardlink'):
+    """
+    Place source at destination with the link mode, falling back to a byte copy.
+
+    An existing destination is replaced. Returns the mode actually used.
+    """
+    if os.path.lexists(destination):
+        os.remove(destination)
+    if link == 'reflink':
+        try:
+            _reflink(source, destination)
+            return 'reflink'
+        except OSError:
+            pass
+    elif link == 'hardlink':
+        try:
+            os.link(source, destination)
+            return 'hardlink'
+        except OSError:
+            pass
+    elif link == 'symlink':
+        try:
+            os.symlink(os.path.abspath(source), destination)
+            return 'symlink'
+        except OSError:
+            pass
+    shutil.copyfile(source, destination)
+    return 'copy'
+
+def _run(jobs, threads):
+    """Run (function, args) jobs on threads; returns {outcome: count} of their return values."""
+    counts = {}
+    with ThreadPoolExecutor(max(1, threads)) as executor:
+        for outcome in executor.map(lambda job: job[0](*job[1]), jobs):
+            counts[outcome] = counts.get(outcome, 0) + 1
+    return counts
+
+def prune_categories(root, expected):
+    """
+    Make the category_*/ folders of root hold only the expected files.
+
+    expected maps a folder name to the file names it should contain; other
+    files in those folders are removed, and category_*/ folders that are not
+    in expected (categories that no longer exist) are removed entirely.
+    Returns the number of files and folders removed.
+    """
+    removed = 0
+    for folder in Path(root).iterdir():
+        if not folder.name.startswith('category_') or not folder.is_dir() or folder.is_symlink():
+            continue
+        if folder.name not in expected:
+            shutil.rmtree(folder)
+            removed += 1
+            continue
+        for path in folder.iterdir():
+            if path.name not in expected[folder.name]:
+                if path.is_dir() and not path.is_symlink():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+                removed += 1
+    return removed
+
+def materialize_crops(manifest, category_dir, link='hardlink', threads=THREADS):
+    """
+    Create category_dir/category_{id}/ folders holding the crops of the manifest.
+
+    Crop files are linked (see link_file), never decoded and re-encoded;
+    crops of a face store are written straight from their shard bytes.
+    Crops and folders left from an earlier clustering are removed (see
+    prune_categories), so the folders match the manifest.
+    Returns {mode used: count}.
+    """
+    store = FaceStore(manifest['face_dir']) if manifest['store'] else None
+    records = {record['name']: record for record in store} if store is not None else {}
+
+    def write_stored(name, destination):
+        if os.path.lexists(destination):
+            os.remove(destination)
+        store.data(records[name]).tofile(destination)
+        return 'copy'
+
+    jobs, expected = [], {}
+    for category, entries in manifest['categories'].items():
+        folder = Path(category_dir) / f"category_{category}"
+        folder.mkdir(parents=True, exist_ok=True)
+        expected[folder.name] = {entry['crop'] for entry in entries}
+        for entry in entries:
+            destination = str(folder / entry['crop'])
+            if entry['path'] is None:
+                jobs.append((write_stored, (entry['crop'], destination)))
+            else:
+                jobs.append((link_file, (entry['path'], destination, link)))
+    Path(category_dir).mkdir(parents=True, exist_ok=True)
+    prune_categories(category_dir, expected)
+    return _run(jobs, threads)
+
+def source_image(entry, image_dir):
+    """Return the original image of a manifest entry: its stored source, else image_dir/{crop without _face_N}."""
+    if entry.get('source'):
+        return entry['source']
+    return os.path.join(image_dir, re.sub(r'_face_\d+', '', entry['crop']))
+
+def materialize_sources(manifest, copy_dir, image_dir, link='hardlink', threads=THREADS):
+    """
+    Create copy_dir/category_{id}/ folders holding the original image of every crop.
+
+    Each source image is placed once per category however many of its
+    faces are in it. Sources that no longer exist are skipped and counted
+    as 'missing'. Images and folders left from an earlier clustering are
+    removed (see prune_categories). Returns {mode used: count}.
+    """
+    jobs, expected = [], {}
+    for category, entries in manifest['categories'].items():
+        folder = Path(copy_dir) / f"category_{category}"
+        folder.mkdir(parents=True, exist_ok=True)
+        # One file per source image (and per name, so no two jobs write the same path)
+        sources = {}
+        for entry in entries:
+            source = source_image(entry, image_dir)
+            sources.setdefault(os.path.basename(source), source)
+        expected[folder.name] = {name for name, source in sources.items() if os.path.isfile(source)}
+        for source in sources.values():
+            if not os.path.isfile(source):
+                jobs.append((lambda: 'missing', ()))
+                continue
+            jobs.append((link_file, (source, str(folder / os.path.basename(source)), link)))
+    Path(copy_dir).mkdir(parents=True, exist_ok=True)
+    prune_categories(copy_dir, expected)
+    return _run(jobs, threads)
+
+def scan_categories(category_dir):
+    """Return a manifest for category_dir/category_*/ crop folders written without one."""
+    faces, labels = [], []
+    for folder in sorted(Path(category_dir).iterdir()):
+        if folder.is_dir() and folder.name.startswith('category_'):
+            for crop in sorted(list(folder.glob('*.jpg')) + list(folder.glob('*.png'))):
+                faces.append(crop)
+                labels.append(int(folder.name[len('category_'):]))
+    return build_manifest(faces, labels, category_dir)
@@ -1,72 +1,596 @@
 import os
+import hashlib
+import json
+import shutil
+import stat
+import tempfile
+from collections import deque
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 import argparse
 
-def compress_image(input_path, output_path, quality=95):
+MANIFEST_NAME = '.compress_manifest.json'
+
+# IJG standard luminance quantization table (quality 50)
+STD_LUMINANCE_TABLE = [
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99,
+]
+
+def _file_sha256(path, chunk_size=1024 * 1024):
+    """Return the hex SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Process umask, read once at import (os.umask can only be read by setting it)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _atomic_write(output_path, write):
     """
-    Compress a single image using high JPEG quality to preserve visual quality.
-    
+    Call write(tmp_path) and rename the temp file over output_path.
+
+    The temp file lives next to the output so the rename is atomic; a killed
+    run leaves at most a stray hidden .tmp file, never a truncated output.
+    mkstemp creates the file as 0600, so before the rename it gets the mode
+    of the file it replaces, or the mode a plain open() would have given it.
+    A temp path that write() hard-linked to another file keeps its mode, as
+    changing it would change that file too.
+    """
+    directory = os.path.dirname(output_path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        if os.stat(tmp_path).st_nlink == 1:
+            try:
+                mode = stat.S_IMODE(os.stat(output_path).st_mode)
+            except FileNotFoundError:
+                mode = 0o666 & ~_UMASK
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def load_manifest(output_dir):
+    """Load the incremental-run manifest from output_dir (empty if missing)."""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'version': 1, 'files': {}}
+    manifest.setdefault('files', {})
+    return manifest
+
+def save_manifest(output_dir, manifest):
+    """Atomically write the incremental-run manifest to output_dir."""
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+    _atomic_write(os.path.join(output_dir, MANIFEST_NAME), write)
+
+def parse_size(text):
+    """Parse a byte size such as '350000', '500k' or '1.5M' into bytes."""
+    text = str(text).strip().upper().rstrip('B')
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if text and text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+def _luma(img):
+    """Return the luma channel of a PIL image as a float32 NumPy array."""
+    import numpy as np
+    return np.asarray(img.convert('L'), dtype=np.float32)
+
+def psnr(reference, candidate):
+    """Peak signal-to-noise ratio (dB) between two luma arrays."""
+    import numpy as np
+    diff = reference - candidate
+    mse = float(np.mean(np.square(diff, out=diff), dtype=np.float64))
+    if mse == 0:
+        return float('inf')
+    return float(10 * np.log10(255.0 ** 2 / mse))
+
+def _box_mean(a, k):
+    """Mean over every k x k window of a 2-D float32 array (valid region only)."""
+    import cv2
+    # cv2.blur is a running-sum box filter; the border rows it pads are cut off
+    mean = cv2.blur(a, (k, k), borderType=cv2.BORDER_REFLECT)
+    top, left = k // 2, k // 2
+    return mean[top:top + a.shape[0] - k + 1, left:left + a.shape[1] - k + 1]
+
+def ssim(reference, candidate, window=7):
+    """
+    Mean structural similarity between two luma arrays (uniform window).
+
+    Works in float32 and folds the variance terms into as few full-size
+    arrays as possible, so a 24 MP image needs a few hundred MB, not GBs.
+    """
+    import numpy as np
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    window = max(1, min(window, *reference.shape))
+    mu_x = _box_mean(reference, window)
+    mu_y = _box_mean(candidate, window)
+    mu_xy = mu_x * mu_y
+    # mu_x^2 + mu_y^2, built in mu_x's buffer
+    mu_sq = np.square(mu_x, out=mu_x)
+    mu_sq += np.square(mu_y, out=mu_y)
+    del mu_y
+    # var_x + var_y + c2 and 2 * cov + c2
+    variance = _box_mean(reference * reference + candidate * candidate, window)
+    variance -= mu_sq
+    variance += c2
+    covariance = _box_mean(reference * candidate, window)
+    covariance -= mu_xy
+    covariance *= 2
+    covariance += c2
+    # ((2 mu_x mu_y + c1) * (2 cov + c2)) / ((mu_x^2 + mu_y^2 + c1) * (var_x + var_y + c2))
+    mu_xy *= 2
+    mu_xy += c1
+    mu_xy *= covariance
+    mu_sq += c1
+    mu_sq *= variance
+    mu_xy /= mu_sq
+    return float(mu_xy.mean(dtype=np.float64))
+
+def search_quality(img, q_min=30, q_max=95, target_bytes=None, min_ssim=None,
+                   min_psnr=None, max_attempts=7):
+    """
+    Binary-search the JPEG quality for one already-decoded image.
+
+    Candidates are encoded into in-memory buffers. With min_ssim/min_psnr the
+    lowest quality meeting the threshold is chosen; with target_bytes the
+    highest quality that fits is chosen. If both are set the size limit
+    wins: the size bound is searched first and the threshold search only
+    runs below it (each search gets about half the attempts), so a tested
+    quality that fits is always preferred over one that does not. The
+    source luma is computed once and reused for every candidate. If the
+    attempt budget runs out first, the closest tested candidate is used.
+
+    Args:
+        img (PIL.Image): Decoded source image in a JPEG-compatible mode
+        q_min (int): Lowest quality to consider
+        q_max (int): Highest quality to consider
+        target_bytes (int): Maximum output size in bytes
+        min_ssim (float): Minimum SSIM against the source (0-1)
+        min_psnr (float): Minimum PSNR against the source in dB
+        max_attempts (int): Maximum number of encodes
+
+    Returns:
+        tuple: (quality, encoded JPEG bytes, number of encodes)
+    """
+    encoded = {}
+    scores = {}
+    reference = _luma(img) if (min_ssim is not None or min_psnr is not None) else None
+
+    def encode(q):
+        if q not in encoded:
+            buf = BytesIO()
+            img.save(buf, 'JPEG', quality=q, optimize=True)
+            encoded[q] = buf.getvalue()
+        return encoded[q]
+
+    def fits(q):
+        return len(encode(q)) <= target_bytes
+
+    def looks_good(q):
+        if q not in scores:
+            with Image.open(BytesIO(encode(q))) as decoded:
+                candidate = _luma(decoded)
+            scores[q] = (ssim(reference, candidate) if min_ssim is not None else None,
+                         psnr(reference, candidate) if min_psnr is not None else None)
+        ssim_score, psnr_score = scores[q]
+        return ((min_ssim is None or ssim_score >= min_ssim) and
+                (min_psnr is None or psnr_score >= min_psnr))
+
+    def bisect(lo, hi, ok, want_highest, budget=max_attempts):
+        best = None
+        while lo <= hi and (len(encoded) < budget or (lo + hi) // 2 in encoded):
+            mid = (lo + hi) // 2
+            if ok(mid):
+                best = mid
+                if want_highest:
+                    lo = mid + 1
+                else:
+                    hi = mid - 1
+            elif want_highest:
+                hi = mid - 1
+            else:
+                lo = mid + 1
+        return best
+
+    size_max = q_max
+    if target_bytes is not None and not fits(q_max):
+        # With a threshold too, half the encodes are kept for its search
+        budget = max_attempts if reference is None else max(1, (max_attempts + 1) // 2)
+        size_max = bisect(q_min, q_max - 1, fits, want_highest=True, budget=budget)
+        if size_max is None and budget < max_attempts:
+            # Nothing fits yet: the threshold cannot matter, so keep going lower
+            size_max = bisect(q_min, min(encoded) - 1, fits, want_highest=True)
+        if size_max is None:
+            # Nothing tested fits: the lowest tested quality is the smallest file
+            quality = min(encoded)
+            return quality, encode(quality), len(encoded)
+
+    quality = size_max
+    if reference is not None:
+        good = bisect(q_min, size_max, looks_good, want_highest=False)
+        # Nothing tested was good enough: keep the best quality that fits.
+        # JPEG size is not strictly monotonic, so re-check the size too.
+        if good is not None and (target_bytes is None or fits(good)):
+            quality = good
+    return quality, encode(quality), len(encoded)
+
+def estimate_jpeg_quality(img):
+    """
+    Estimate the IJG quality a JPEG was saved with from its quantization tables.
+
+    Only the header is needed (Pillow parses DQT markers in Image.open), so no
+    pixel data is decoded. Returns None for non-JPEG images.
+    """
+    tables = getattr(img, 'quantization', None)
+    if img.format != 'JPEG' or not tables:
+        return None
+    luminance = tables[min(tables)]
+    # Inverse of the IJG scaling: table = std * scale / 100
+    scale = 100.0 * sum(luminance) / sum(STD_LUMINANCE_TABLE)
+    quality = 5000.0 / scale if scale > 100 else (200.0 - scale) / 2
+    return int(round(min(100, max(1, quality))))
+
+def _pass_through(input_path, output_path, mode):
+    """Hard-link (mode 'link') or copy the source to output_path; returns the action."""
+    def write(tmp_path):
+        if mode == 'link':
+            os.remove(tmp_path)
+            try:
+                os.link(input_path, tmp_path)
+                return
+            except OSError:
+                # Cross-device or unsupported filesystem: fall back to a copy
+                pass
+        shutil.copyfile(input_path, tmp_path)
+
+    _atomic_write(output_path, write)
+    return 'linked' if mode == 'link' and os.path.samefile(input_path, output_path) else 'copied'
+
+def _open_downscaled(img, max_size):
+    """
+    Downscale an opened (not yet loaded) image so its longer side is max_size.
+
+    JPEG sources are decoded with draft() at 1/2, 1/4 or 1/8 scale straight
+    from the DCT data; other formats use reduce() through reducing_gap. The
+    result is finished with a Lanczos resample to the exact size.
+    """
+    width, height = img.size
+    scale = max_size / max(width, height)
+    if scale >= 1:
+        return img
+    target = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if img.format == 'JPEG':
+        # Must happen before the image is loaded; keeps size >= target
+        img.draft(img.mode, target)
+    if img.mode in ('RGBA', 'P'):
+        img = img.convert('RGB')
+    return img.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+def _compress_one(input_path, output_path, quality=95, record=False, known_sha256=None,
+                  max_size=None, target_bytes=None, min_ssim=None, min_psnr=None,
+                  min_quality=30, max_attempts=7, passthrough=None):
+    """
+    Compress a single image and return a result record instead of printing.
+
     Args:
         input_path (str): Path to input image
         output_path (str): Path to save compressed image
         quality (int): JPEG quality (1-100, higher = better quality)
+        record (bool): Also record the source mtime and content hash
+        known_sha256 (str): Hash of the source from a previous run with the
+            same settings; if the content still matches, the image is skipped
+            without being decoded
+        max_size (int): Downscale so the longer side is at most this many pixels
+        target_bytes, min_ssim, min_psnr (optional): Search the quality per
+            image between min_quality and quality (see search_quality)
+        min_quality (int): Lower bound for the quality search
+        max_attempts (int): Maximum encodes per image for the quality search
+        passthrough (str): 'copy' or 'link' JPEG sources byte-for-byte when
+            their estimated quality is already at or below quality and
+            re-encoding would not help
+
+    Returns:
+        dict: input/output paths, action taken, success flag, input and
+        output size in bytes, and the error message when compression failed
     """
+    result = {
+        'input': input_path,
+        'output': output_path,
+        'action': None,
+        'success': False,
+        'input_size': None,
+        'output_size': None,
+        'error': None,
+    }
     try:
+        stat = os.stat(input_path)
+        result['input_size'] = stat.st_size
+        if record or known_sha256:
+            result['mtime_ns'] = stat.st_mtime_ns
+            result['sha256'] = _file_sha256(input_path)
+            if known_sha256 == result['sha256'] and os.path.exists(output_path):
+                result['action'] = 'skipped'
+                result['output_size'] = os.path.getsize(output_path)
+                result['success'] = True
+                return result
+
         with Image.open(input_path) as img:
+            if passthrough:
+                source_quality = estimate_jpeg_quality(img)
+                result['source_quality'] = source_quality
+                if (source_quality is not None and source_quality <= quality
+                        and img.mode in ('RGB', 'L')
+                        and (not max_size or max(img.size) <= max_size)
+                        and min_ssim is None and min_psnr is None
+                        and (target_bytes is None or stat.st_size <= target_bytes)):
+                    result['action'] = _pass_through(input_path, output_path, passthrough)
+                    result['output_size'] = stat.st_size
+                    result['success'] = True
+                    return result
+
+            if max_size:
+                img = _open_downscaled(img, max_size)
+
             # Convert to RGB if necessary (required for JPEG)
             if img.mode in ('RGBA', 'P'):
                 img = img.convert('RGB')
-            
-            # Save with specified quality and optimization
-            img.save(output_path, 'JPEG', quality=quality, optimize=True)
-            print(f"Compressed: {os.path.basename(input_path)} -> {os.path.basename(output_path)}")
+
+            if target_bytes is not None or min_ssim is not None or min_psnr is not None:
+                chosen, data, attempts = search_quality(
+                    img, min_quality, quality, target_bytes, min_ssim, min_psnr, max_attempts)
+                result['quality'] = chosen
+                result['attempts'] = attempts
+
+                def write(tmp_path):
+                    with open(tmp_path, 'wb') as f:
+                        f.write(data)
+                _atomic_write(output_path, write)
+            else:
+                # Save with specified quality and optimization
+                _atomic_write(output_path, lambda tmp_path: img.save(
+                    tmp_path, 'JPEG', quality=quality, optimize=True))
+        result['action'] = 'compressed'
+        result['output_size'] = os.path.getsize(output_path)
+        result['success'] = True
     except Exception as e:
-        print(f"Error processing {input_path}: {str(e)}")
+        result['error'] = str(e)
+    return result
+
+def _print_result(result):
+    """Print a one-line summary of a compression result."""
+    if result['action'] == 'skipped':
+        print(f"Skipped (unchanged): {os.path.basename(result['input'])}")
+    elif result['action'] in ('copied', 'linked'):
+        print(f"{result['action'].capitalize()}: {os.path.basename(result['input'])} -> "
+              f"{os.path.basename(result['output'])} (source q~{result['source_quality']}, not re-encoded)")
+    elif result['success']:
+        searched = (f" [q={result['quality']}, {result['attempts']} encodes]"
+                    if 'quality' in result else "")
+        print(f"Compressed: {os.path.basename(result['input'])} -> {os.path.basename(result['output'])} "
+              f"({result['input_size'] / 1024:.1f}KB -> {result['output_size'] / 1024:.1f}KB){searched}")
+    else:
+        print(f"Error processing {result['input']}: {result['error']}")
+
+def compress_image(input_path, output_path, quality=95):
+    """
+    Compress a single image using high JPEG quality to preserve visual quality.
+
+    Args:
+        input_path (str): Path to input image
+        output_path (str): Path to save compressed image
+        quality (int): JPEG quality (1-100, higher = better quality)
+
+    Returns:
+        dict: Result record (see _compress_one)
+    """
+    result = _compress_one(input_path, output_path, quality)
+    _print_result(result)
+    return result
 
-def compress_directory(input_dir, output_dir, quality=95):
+def _compress_task(task):
+    """Process pool entry point; unpacks an (input, output, options) tuple."""
+    input_path, output_path, options = task
+    return _compress_one(input_path, output_path, **options)
+
+def _run_tasks(tasks, workers):
+    """
+    Yield results for tasks in submission order.
+
+    Items that are already result dicts (e.g. unchanged files found from the
+    manifest) pass straight through. With workers > 1 the remaining tasks are
+    spread across a process pool, keeping at most 2 * workers files in flight
+    so memory stays flat on huge directories.
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield task if isinstance(task, dict) else _compress_task(task)
+        return
+
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        in_flight = 0
+        for task in tasks:
+            if isinstance(task, dict):
+                pending.append(task)
+            else:
+                pending.append(executor.submit(_compress_task, task))
+                in_flight += 1
+            while pending and (in_flight >= max_in_flight or isinstance(pending[0], dict)):
+                item = pending.popleft()
+                if isinstance(item, dict):
+                    yield item
+                else:
+                    in_flight -= 1
+                    yield item.result()
+        while pending:
+            item = pending.popleft()
+            yield item if isinstance(item, dict) else item.result()
+
+def compress_directory(input_dir, output_dir, quality=95, workers=1, incremental=False,
+                       max_size=None, passthrough=None, **search_options):
     """
     Compress all images in input directory to output directory.
-    
+
     Args:
         input_dir (str): Input directory containing images
         output_dir (str): Output directory for compressed images
         quality (int): JPEG quality (1-100)
+        workers (int): Number of worker processes (1 = sequential)
+        incremental (bool): Skip sources that are unchanged since the last
+            run with the same settings, using a manifest in output_dir
+        max_size (int): Downscale so the longer side is at most this many pixels
+        passthrough (str): 'copy' or 'link' already-efficient JPEGs instead
+            of re-encoding them
+        **search_options: target_bytes, min_ssim, min_psnr, min_quality and
+            max_attempts for per-image quality search (see search_quality)
+
+    Returns:
+        list: Result records in input file order
     """
     # Supported image extensions
     image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
-    
+
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
-    
-    compressed_count = 0
-    
-    for filename in os.listdir(input_dir):
-        if os.path.splitext(filename.lower())[1] in image_extensions:
-            input_path = os.path.join(input_dir, filename)
-            
-            # Generate output filename (convert to .jpg)
-            name, ext = os.path.splitext(filename)
-            output_filename = f"{name}_compressed.jpg"
-            output_path = os.path.join(output_dir, output_filename)
-            
-            compress_image(input_path, output_path, quality)
-            compressed_count += 1
-    
-    print(f"\nCompleted! Processed {compressed_count} images.")
+
+    # Everything that affects the output bytes; a change forces a re-encode
+    settings = {'quality': quality, 'optimize': True, 'max_size': max_size,
+                'passthrough': passthrough}
+    settings.update(search_options)
+    manifest = load_manifest(output_dir) if incremental else None
+
+    def iter_tasks():
+        for filename in sorted(os.listdir(input_dir)):
+            if os.path.splitext(filename.lower())[1] in image_extensions:
+                input_path = os.path.join(input_dir, filename)
+
+                # Generate output filename (convert to .jpg)
+                name, ext = os.path.splitext(filename)
+                output_filename = f"{name}_compressed.jpg"
+                output_path = os.path.join(output_dir, output_filename)
+
+                options = dict(search_options, quality=quality, max_size=max_size,
+                               passthrough=passthrough)
+                if manifest is not None:
+                    options['record'] = True
+                    entry = manifest['files'].get(filename)
+                    if (entry and entry.get('settings') == settings
+                            and os.path.exists(output_path)):
+                        stat = os.stat(input_path)
+                        if (entry['size'] == stat.st_size
+                                and entry['mtime_ns'] == stat.st_mtime_ns):
+                            # Unchanged on disk: skip without opening the file
+                            yield {
+                                'input': input_path, 'output': output_path,
+                                'action': 'skipped', 'success': True,
+                                'input_size': stat.st_size,
+                                'output_size': os.path.getsize(output_path),
+                                'error': None,
+                            }
+                            continue
+                        # Touched but possibly identical: let the worker compare hashes
+                        options['known_sha256'] = entry['sha256']
+
+                yield (input_path, output_path, options)
+
+    results = []
+    try:
+        for result in _run_tasks(iter_tasks(), workers):
+            _print_result(result)
+            results.append(result)
+            # Stat-level skips carry no hash and need no update
+            if manifest is not None and result['success'] and 'sha256' in result:
+                manifest['files'][os.path.basename(result['input'])] = {
+                    'size': result['input_size'],
+                    'mtime_ns': result['mtime_ns'],
+                    'sha256': result['sha256'],
+                    'settings': settings,
+                    'output': os.path.basename(result['output']),
+                }
+                if len(results) % 100 == 0:
+                    save_manifest(output_dir, manifest)
+    finally:
+        if manifest is not None:
+            save_manifest(output_dir, manifest)
+
+    failed = sum(1 for r in results if not r['success'])
+    skipped_count = sum(1 for r in results if r['action'] == 'skipped')
+    passed_count = sum(1 for r in results if r['action'] in ('copied', 'linked'))
+    input_total = sum(r['input_size'] for r in results if r['success'])
+    output_total = sum(r['output_size'] for r in results if r['success'])
+    print(f"\nCompleted! Processed {len(results)} images "
+          f"({failed} failed, {skipped_count} unchanged, {passed_count} passed through).")
+    if input_total:
+        print(f"Total: {input_total / (1024*1024):.1f}MB -> {output_total / (1024*1024):.1f}MB")
+    return results
 
 def main():
     parser = argparse.ArgumentParser(description="Compress images without losing quality")
     parser.add_argument("input_dir", help="Input directory containing images")
     parser.add_argument("output_dir", help="Output directory for compressed images")
-    parser.add_argument("-q", "--quality", type=int, default=95, 
+    parser.add_argument("-q", "--quality", type=int, default=95,
                        help="JPEG quality (1-100, default: 95)")
-    
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                       help="Number of worker processes (default: 1, 0 = all CPUs)")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                       help="Skip images unchanged since the last run with the same settings")
+    parser.add_argument("--max-size", type=int,
+                       help="Downscale so the longer side is at most this many pixels (e.g. 2048)")
+    parser.add_argument("--passthrough", choices=['copy', 'link'],
+                       help="Copy or hard-link JPEGs already at or below the quality instead of re-encoding")
+    parser.add_argument("--target-size", type=parse_size,
+                       help="Search quality per image for the largest output under this size (e.g. 500k)")
+    parser.add_argument("--min-ssim", type=float,
+                       help="Search quality per image for the smallest output with at least this SSIM (e.g. 0.98)")
+    parser.add_argument("--min-psnr", type=float,
+                       help="Search quality per image for the smallest output with at least this PSNR in dB")
+    parser.add_argument("--min-quality", type=int, default=30,
+                       help="Lowest quality tried by the search (default: 30; -q is the highest)")
+    parser.add_argument("--max-attempts", type=int, default=7,
+                       help="Maximum encodes per image for the search (default: 7)")
+
     args = parser.parse_args()
-    
+    workers = args.workers or os.cpu_count() or 1
+
     print(f"Compressing images from '{args.input_dir}' to '{args.output_dir}'")
     print(f"Quality setting: {args.quality}")
-    
-    compress_directory(args.input_dir, args.output_dir, args.quality)
+    if args.max_size:
+        print(f"Max size: {args.max_size}px")
+    if workers > 1:
+        print(f"Workers: {workers}")
+
+    search_options = {}
+    if args.target_size or args.min_ssim or args.min_psnr:
+        search_options = {'target_bytes': args.target_size, 'min_ssim': args.min_ssim,
+                          'min_psnr': args.min_psnr, 'min_quality': args.min_quality,
+                          'max_attempts': args.max_attempts}
+        print(f"Quality search: {args.min_quality}-{args.quality}, at most {args.max_attempts} encodes")
+
+    compress_directory(args.input_dir, args.output_dir, args.quality, workers,
+                       incremental=args.incremental, max_size=args.max_size,
+                       passthrough=args.passthrough, **search_options)
 
 if __name__ == "__main__":
     main()
@@ -1,88 +1,761 @@
 import os
+import json
+import shutil
+import struct
 import subprocess
+import tempfile
+import threading
+import time
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-def compress_video(input_path, output_path, bitrate='2M', resolution='1920x1080', crf=23):
+# ffmpeg processes currently running, so Ctrl-C can stop every job at once
+_running_processes = set()
+_running_lock = threading.Lock()
+_cancelled = threading.Event()
+
+# ffprobe processes run at once while a batch is being encoded
+PROBE_THREADS = 4
+
+def _format_eta(seconds):
+    """Format a number of seconds as H:MM:SS ('?' if unknown)."""
+    if seconds is None or seconds != seconds or seconds == float('inf'):
+        return '?'
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def _parse_progress_block(block):
+    """Convert one ffmpeg -progress key=value block into numbers."""
+    stats = {'frame': _to_number(block.get('frame'), int),
+             'fps': _to_number(block.get('fps')),
+             'speed': _to_number(block.get('speed', '').rstrip('x')),
+             'out_time': None,
+             'total_size': _to_number(block.get('total_size'), int),
+             'state': block.get('progress')}
+    out_time_us = _to_number(block.get('out_time_us'), int)
+    if out_time_us is not None and out_time_us >= 0:
+        stats['out_time'] = out_time_us / 1e6
+    return stats
+
+def _run_ffmpeg(command, on_progress=None, stderr_lines=40):
+    """
+    Run an ffmpeg command, registering the process so cancel_all() can stop it.
+
+    ffmpeg's -progress output is read as a stream and each block is passed to
+    on_progress as a dict (frame, fps, speed, out_time in seconds,
+    total_size, and state 'continue' or 'end'). Only the last stderr_lines lines of stderr are kept.
+
+    Raises:
+        subprocess.CalledProcessError: ffmpeg exited non-zero (or was cancelled);
+            stderr holds the retained tail
+    """
+    if _cancelled.is_set():
+        raise subprocess.CalledProcessError(-1, command, stderr="cancelled")
+    command = [command[0], '-progress', 'pipe:1', '-nostats'] + command[1:]
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, text=True, errors='replace')
+    with _running_lock:
+        _running_processes.add(process)
+    tail = deque(maxlen=stderr_lines)
+    stderr_reader = threading.Thread(target=lambda: tail.extend(process.stderr), daemon=True)
+    stderr_reader.start()
+    try:
+        block = {}
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            block[key] = value
+            if key == 'progress':
+                if on_progress is not None:
+                    on_progress(_parse_progress_block(block))
+                block = {}
+        process.wait()
+        stderr_reader.join()
+    finally:
+        with _running_lock:
+            _running_processes.discard(process)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=''.join(tail))
+
+class BatchProgress:
+    """
+    Thread-safe live progress for a batch of ffmpeg jobs.
+
+    Tracks encoded media seconds per file against the probed durations and
+    prints a line with per-file fps, speed and ETA plus the batch ETA, at
+    most once per interval for each file, so every running job shows up.
+    """
+
+    def __init__(self, total_duration=None, interval=5.0):
+        self.total_duration = total_duration
+        self.interval = interval
+        self.start = time.monotonic()
+        self.done = {}
+        self.last_print = {}
+        self.lock = threading.Lock()
+
+    def callback(self, name, duration):
+        """Return an on_progress callback for one file."""
+        def update(stats):
+            with self.lock:
+                if stats['out_time'] is not None:
+                    self.done[name] = stats['out_time']
+                now = time.monotonic()
+                if stats['state'] == 'end' or now - self.last_print.get(name, 0.0) < self.interval:
+                    return
+                self.last_print[name] = now
+                print(self._line(name, duration, stats, now))
+        return update
+
+    def finish(self, name, duration):
+        """Count a finished file as fully encoded."""
+        with self.lock:
+            self.last_print.pop(name, None)
+            if duration:
+                self.done[name] = duration
+
+    def _line(self, name, duration, stats, now):
+        speed = stats['speed']
+        out_time = stats['out_time'] or 0.0
+        eta = (duration - out_time) / speed if duration and speed else None
+        percent = f"{100 * out_time / duration:.0f}%" if duration else "?%"
+        line = (f"  ⏳ {name}: {percent} | {stats['fps'] or 0:.0f} fps | "
+                f"{speed or 0:.2f}x | ETA {_format_eta(eta)}")
+        if self.total_duration:
+            done = sum(self.done.values())
+            elapsed = now - self.start
+            rate = done / elapsed if elapsed > 0 else 0
+            batch_eta = (self.total_duration - done) / rate if rate else None
+            line += (f" || batch {100 * done / self.total_duration:.0f}% "
+                     f"ETA {_format_eta(batch_eta)}")
+        return line
+
+def cancel_all():
+    """
+    Stop all running ffmpeg jobs and prevent new ones from starting.
+
+    New jobs stay blocked until the next compress_directory call (or
+    reset_cancel()), so a batch that is being cancelled cannot restart.
+    """
+    _cancelled.set()
+    with _running_lock:
+        processes = list(_running_processes)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def reset_cancel():
+    """Allow ffmpeg jobs to start again after cancel_all()."""
+    _cancelled.clear()
+
+def parse_bitrate(bitrate):
+    """Parse an ffmpeg-style bitrate such as '2M' or '128k' into bits per second."""
+    text = str(bitrate).strip()
+    multipliers = {'k': 1000, 'K': 1000, 'm': 1000000, 'M': 1000000}
+    if text and text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(float(text))
+
+def _to_number(value, cast=float):
+    """Convert an ffprobe field to a number, or None if missing/'N/A'."""
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+def probe_video(input_path):
+    """
+    Run ffprobe once and summarize the streams compress_video cares about.
+
+    Returns:
+        dict: format name, duration (s), total bitrate, and 'video'/'audio'
+        dicts (codec, width, height, pix_fmt, bit_rate, and rotation in
+        degrees for video) or None if absent
+    """
+    command = ['ffprobe', '-v', 'error', '-print_format', 'json',
+               '-show_format', '-show_streams', input_path]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    data = json.loads(output)
+    fmt = data.get('format', {})
+    info = {
+        'format_name': fmt.get('format_name', ''),
+        'duration': _to_number(fmt.get('duration')),
+        'bit_rate': _to_number(fmt.get('bit_rate'), int),
+        'video': None,
+        'audio': None,
+    }
+    for stream in data.get('streams', []):
+        kind = stream.get('codec_type')
+        if kind == 'video' and info['video'] is None and not stream.get('disposition', {}).get('attached_pic'):
+            # Display rotation: old muxers use a tag, newer ones side data
+            rotation = _to_number(stream.get('tags', {}).get('rotate'), int)
+            for side_data in stream.get('side_data_list', []):
+                if 'rotation' in side_data:
+                    rotation = _to_number(side_data['rotation'], int)
+            info['video'] = {
+                'codec': stream.get('codec_name'),
+                'width': stream.get('width'),
+                'height': stream.get('height'),
+                'pix_fmt': stream.get('pix_fmt'),
+                'bit_rate': _to_number(stream.get('bit_rate'), int),
+                'rotation': rotation or 0,
+            }
+        elif kind == 'audio' and info['audio'] is None:
+            info['audio'] = {
+                'codec': stream.get('codec_name'),
+                'bit_rate': _to_number(stream.get('bit_rate'), int),
+            }
+    if info['duration'] is None:
+        durations = [_to_number(s.get('duration')) for s in data.get('streams', [])]
+        durations = [d for d in durations if d]
+        info['duration'] = max(durations) if durations else None
+    return info
+
+def is_faststart(path):
+    """Return True if an MP4/MOV file has its moov atom before mdat."""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return False
+                size, kind = struct.unpack('>I4s', header)
+                if kind == b'moov':
+                    return True
+                if kind == b'mdat':
+                    return False
+                if size == 1:
+                    size = struct.unpack('>Q', f.read(8))[0]
+                    f.seek(size - 16, os.SEEK_CUR)
+                elif size == 0:
+                    return False
+                else:
+                    f.seek(size - 8, os.SEEK_CUR)
+    except OSError:
+        return False
+
+def plan_compression(info, input_path, bitrate='2M', resolution='1920x1080', audio_bitrate='128k'):
+    """
+    Decide the cheapest way to bring a probed video within the targets.
+
+    Returns:
+        dict: 'action' is 'skip' (copy the file as is), 'remux' (stream copy
+        with +faststart) or 'encode'; 'video' and 'audio' are 'copy' or
+        'encode' ('audio' is None without an audio stream); 'reason' says why
+    """
+    max_width, max_height = (int(v) for v in resolution.lower().split('x'))
+    video = info['video']
+    audio = info['audio']
+
+    video_ok = False
+    if video is not None:
+        video_rate = video['bit_rate']
+        if video_rate is None and info['bit_rate'] is not None:
+            # Containers like MKV only report the total bitrate
+            video_rate = info['bit_rate'] - ((audio or {}).get('bit_rate') or 0)
+        width, height = video['width'] or 0, video['height'] or 0
+        if (video.get('rotation') or 0) % 180:
+            # Players (and ffmpeg's scale on encode) use the rotated size
+            width, height = height, width
+        video_ok = (video['codec'] == 'h264'
+                    and video['pix_fmt'] in ('yuv420p', 'yuvj420p')
+                    and width <= max_width
+                    and height <= max_height
+                    and video_rate is not None
+                    and video_rate <= parse_bitrate(bitrate))
+    audio_ok = audio is None or (audio['codec'] == 'aac' and
+                                 (audio['bit_rate'] or 0) <= parse_bitrate(audio_bitrate))
+    audio_plan = None if audio is None else ('copy' if audio_ok else 'encode')
+
+    if video_ok and audio_ok:
+        is_mp4 = Path(input_path).suffix.lower() in ('.mp4', '.m4v')
+        if is_mp4 and is_faststart(input_path):
+            return {'action': 'skip', 'video': 'copy', 'audio': audio_plan,
+                    'reason': 'already H.264/AAC within limits with faststart'}
+        return {'action': 'remux', 'video': 'copy', 'audio': audio_plan,
+                'reason': 'streams within limits; container needs faststart remux'}
+    return {'action': 'encode', 'video': 'copy' if video_ok else 'encode', 'audio': audio_plan,
+            'reason': 'video within limits' if video_ok else
+                      ('audio within limits' if audio_ok else 'full re-encode')}
+
+RATE_CONTROL_MODES = ('crf', 'capped', '2pass')
+
+def _video_encode_args(resolution, crf, threads, bitrate='2M', rate_control='crf'):
+    """
+    ffmpeg output options for the libx264 video encode.
+
+    rate_control is 'crf' (unbounded constant quality), 'capped' (CRF with
+    -maxrate/-bufsize from bitrate) or '2pass' (average bitrate; the -pass
+    options are added by _run_video_encode).
+    """
+    args = [
+        '-vf', f'scale={resolution}:force_original_aspect_ratio=decrease',  # Preserve aspect ratio
+        '-c:v', 'libx264',  # H.264 codec
+    ]
+    if rate_control == '2pass':
+        args += ['-b:v', bitrate]  # Average bitrate target
+    else:
+        args += ['-crf', str(crf)]  # Quality (18-23 is visually lossless)
+        if rate_control == 'capped':
+            # VBV cap: peaks limited to bitrate over a 2 second buffer
+            args += ['-maxrate', bitrate, '-bufsize', str(2 * parse_bitrate(bitrate))]
+    args += [
+        '-preset', 'medium', # Balance speed vs compression
+        '-threads', str(threads),  # Per-job thread budget
+    ]
+    return args
+
+def _audio_args(plan):
+    """ffmpeg output options for the audio stream of a plan."""
+    if plan['audio'] == 'copy':
+        return ['-c:a', 'copy']
+    return ['-c:a', 'aac', '-b:a', '128k']  # Audio codec and bitrate
+
+def _output_args(plan):
+    """Audio and container options shared by every final output."""
+    return _audio_args(plan) + [
+        '-movflags', '+faststart',  # Web optimization
+        '-y',               # Overwrite output
+    ]
+
+def _pass_progress(progress, pass_index, duration):
+    """Scale a two-pass encode's progress so both passes fill one 0-100% run."""
+    if progress is None or not duration:
+        return progress
+
+    def update(stats):
+        out_time = stats['out_time']
+        if out_time is not None:
+            out_time = (pass_index * duration + out_time) / 2
+        speed = stats['speed'] / 2 if stats['speed'] else stats['speed']
+        progress(dict(stats, out_time=out_time, speed=speed))
+    return update
+
+def _run_video_encode(input_args, video_args, output_args, output_path, rate_control='crf',
+                      progress=None, duration=None):
+    """
+    Run ffmpeg with input_args + video_args + output_args + output_path.
+
+    With rate_control '2pass', an analysis pass first encodes the video and
+    throws the output away. Its stats go to a temp directory private to this call, so
+    parallel jobs and segments never share a passlogfile.
+    """
+    if rate_control != '2pass':
+        _run_ffmpeg(['ffmpeg', '-nostdin'] + input_args + video_args + output_args + [output_path],
+                    progress)
+        return
+    stats_dir = tempfile.mkdtemp(prefix='.x264stats_', dir=os.path.dirname(output_path) or '.')
+    passlog = os.path.join(stats_dir, 'x264')
+    try:
+        _run_ffmpeg(['ffmpeg', '-nostdin'] + input_args + video_args
+                    # The mp4 muxer (not null) so frame sync, and so the frame
+                    # count, matches pass 2; the bytes themselves are discarded
+                    + ['-pass', '1', '-passlogfile', passlog, '-an', '-f', 'mp4', '-y', os.devnull],
+                    _pass_progress(progress, 0, duration))
+        _run_ffmpeg(['ffmpeg', '-nostdin'] + input_args + video_args
+                    + ['-pass', '2', '-passlogfile', passlog] + output_args + [output_path],
+                    _pass_progress(progress, 1, duration))
+    finally:
+        shutil.rmtree(stats_dir, ignore_errors=True)
+
+def _encode_segmented(input_path, output_path, plan, video_args, rate_control, jobs,
+                      segment_seconds, progress=None):
+    """
+    Encode one long video as keyframe-aligned segments in parallel.
+
+    The video stream is stream-copied into segments of about segment_seconds
+    (the segment muxer only cuts on keyframes), each segment is encoded by
+    its own ffmpeg process (both passes of a two-pass encode stay within the
+    segment's process chain), and the results are joined with the concat
+    demuxer without re-encoding. Audio is taken from the original input in
+    one continuous pass during the join, so segment boundaries cannot cause
+    audio drift. The output gets the same streams and +faststart as a
+    single-pass encode.
+    """
+    work_dir = tempfile.mkdtemp(prefix='.segments_', dir=os.path.dirname(output_path) or '.')
+    try:
+        _run_ffmpeg(['ffmpeg', '-nostdin', '-i', input_path, '-map', '0:v:0', '-c', 'copy',
+                     '-f', 'segment', '-segment_time', str(segment_seconds),
+                     '-reset_timestamps', '1', os.path.join(work_dir, 'src_%05d.mkv')])
+        sources = sorted(f for f in os.listdir(work_dir) if f.startswith('src_'))
+
+        done = {}
+        start = time.monotonic()
+        lock = threading.Lock()
+
+        def segment_progress(index):
+            def update(stats):
+                if progress is None or stats['out_time'] is None:
+                    return
+                with lock:
+                    done[index] = (stats['out_time'], stats['frame'] or 0)
+                    elapsed = time.monotonic() - start
+                    total = sum(t for t, _ in done.values())
+                    frames = sum(n for _, n in done.values())
+                    progress(dict(stats, out_time=total, frame=frames,
+                                  speed=total / elapsed if elapsed > 0 else None,
+                                  fps=frames / elapsed if elapsed > 0 else None,
+                                  state='continue'))
+            return update
+
+        def encode(index, name):
+            encoded = os.path.join(work_dir, f'enc_{index:05d}.mp4')
+            _run_video_encode(['-i', os.path.join(work_dir, name)], video_args, ['-an', '-y'],
+                              encoded, rate_control, segment_progress(index))
+            return encoded
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = [executor.submit(encode, index, name) for index, name in enumerate(sources)]
+            try:
+                encoded = [future.result() for future in futures]
+            except BaseException as e:
+                # Stop before the executor waits for the remaining segments
+                for future in futures:
+                    future.cancel()
+                if isinstance(e, KeyboardInterrupt):
+                    cancel_all()
+                raise
+
+        concat_list = os.path.join(work_dir, 'concat.txt')
+        with open(concat_list, 'w') as f:
+            for path in encoded:
+                f.write(f"file '{os.path.basename(path)}'\n")
+        command = ['ffmpeg', '-nostdin', '-f', 'concat', '-safe', '0', '-i', concat_list,
+                   '-i', input_path, '-map', '0:v:0', '-map', '1:a:0?', '-c:v', 'copy']
+        command += _output_args(plan) + [output_path]
+        _run_ffmpeg(command)
+        return len(sources)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+# Plan used when probing is disabled: always a full re-encode
+FULL_ENCODE = {'action': 'encode', 'video': 'encode', 'audio': 'encode', 'reason': 'probe disabled'}
+
+def _same_file(input_path, output_path):
+    """Return True if output_path is (or resolves to) the input file."""
+    if os.path.exists(output_path):
+        return os.path.samefile(input_path, output_path)
+    return os.path.realpath(input_path) == os.path.realpath(output_path)
+
+def _partial_path(output_path):
+    """Hidden name next to output_path that a job writes to before renaming it into place."""
+    directory, name = os.path.split(output_path)
+    stem, ext = os.path.splitext(name)
+    # Keep the extension, ffmpeg picks the muxer from it
+    return os.path.join(directory, f".{stem}.partial-{os.getpid()}-{threading.get_ident()}{ext}")
+
+def compress_video(input_path, output_path, bitrate='2M', resolution='1920x1080', crf=23, threads=0,
+                   probe=False, info=None, progress=None, segment_jobs=1, segment_seconds=300,
+                   rate_control='capped'):
     """
     Compress a single video using FFmpeg with high quality settings.
-    
+
     Args:
         input_path (str): Input video file
         output_path (str): Output compressed video file
         bitrate (str): Video bitrate (e.g., '2M' for 2Mbps)
         resolution (str): Output resolution (e.g., '1920x1080')
         crf (int): Constant Rate Factor (0-51, lower = better quality)
+        threads (int): ffmpeg/libx264 threads for this job (0 = ffmpeg decides)
+        probe (bool): Run ffprobe first and skip, remux or re-encode only the
+            streams that need it (see plan_compression)
+        info (dict): probe_video() result if already available
+        progress (callable): Receives ffmpeg progress dicts (see _run_ffmpeg)
+        segment_jobs (int): With > 1, encode a video that needs a video
+            re-encode and is longer than 1.5 * segment_seconds as parallel
+            segments (see _encode_segmented)
+        segment_seconds (int): Target segment length in seconds
+        rate_control (str): 'crf' (quality only), 'capped' (CRF limited to
+            bitrate with -maxrate/-bufsize) or '2pass' (two-pass average
+            bitrate)
+
+    Returns:
+        dict: input/output paths, action taken, success flag, sizes in bytes,
+        wall time, media duration, encode speed, size ratio and error
+
+    The output is written under a temporary name and renamed into place
+    only on success, so a failed or cancelled job never touches an existing
+    file at output_path. An output_path that is the input file is refused.
     """
+    result = {
+        'input': input_path,
+        'output': output_path,
+        'action': None,
+        'success': False,
+        'input_size': os.path.getsize(input_path),
+        'output_size': None,
+        'duration': info['duration'] if info else None,
+        'wall_time': None,
+        'speed': None,
+        'ratio': None,
+        'rate_control': None,
+        'error': None,
+    }
+    start = time.monotonic()
+    partial_path = _partial_path(output_path)
     try:
-        # FFmpeg command for high-quality compression
-        command = [
-            'ffmpeg', '-i', input_path,
-            '-vf', f'scale={resolution}:force_original_aspect_ratio=decrease',  # Preserve aspect ratio
-            '-c:v', 'libx264',  # H.264 codec
-            '-crf', str(crf),   # Quality (18-23 is visually lossless)
-            '-preset', 'medium', # Balance speed vs compression
-            '-c:a', 'aac',      # Audio codec
-            '-b:a', '128k',     # Audio bitrate
-            '-movflags', '+faststart',  # Web optimization
-            '-y',               # Overwrite output
-            output_path
-        ]
-        
-        subprocess.run(command, check=True, capture_output=True, text=True)
-        input_size = os.path.getsize(input_path) / (1024*1024)  # MB
-        output_size = os.path.getsize(output_path) / (1024*1024)  # MB
-        print(f"✓ {os.path.basename(input_path)} ({input_size:.1f}MB → {output_size:.1f}MB)")
-        
+        if _same_file(input_path, output_path):
+            raise ValueError("output path is the input file")
+        plan = FULL_ENCODE
+        if probe:
+            if info is None:
+                info = probe_video(input_path)
+                result['duration'] = info['duration']
+            plan = plan_compression(info, input_path, bitrate, resolution)
+        result['action'] = plan['action']
+        result['plan'] = plan
+
+        duration = result['duration']
+        if plan['video'] == 'encode':
+            video_args = _video_encode_args(resolution, crf, threads, bitrate, rate_control)
+            result['rate_control'] = rate_control
+        else:
+            video_args = ['-c:v', 'copy']
+        if plan['action'] == 'skip':
+            shutil.copyfile(input_path, partial_path)
+        elif (plan['video'] == 'encode' and segment_jobs > 1 and duration
+                and duration > 1.5 * segment_seconds):
+            result['segments'] = _encode_segmented(input_path, partial_path, plan, video_args,
+                                                   rate_control, segment_jobs, segment_seconds,
+                                                   progress)
+        else:
+            # FFmpeg command for high-quality compression
+            _run_video_encode(['-i', input_path], video_args, _output_args(plan), partial_path,
+                              result['rate_control'] or 'crf', progress, duration)
+        os.replace(partial_path, output_path)
+        result['output_size'] = os.path.getsize(output_path)
+        result['ratio'] = result['output_size'] / result['input_size'] if result['input_size'] else None
+        result['success'] = True
+        input_size = result['input_size'] / (1024*1024)  # MB
+        output_size = result['output_size'] / (1024*1024)  # MB
+        how = ""
+        if probe:
+            how = f" [{plan['action']}: video {plan['video']}, audio {plan['audio'] or 'none'}]"
+        if 'segments' in result:
+            how += f" [{result['segments']} segments]"
+        print(f"✓ {os.path.basename(input_path)} ({input_size:.1f}MB → {output_size:.1f}MB){how}")
+
     except subprocess.CalledProcessError as e:
-        print(f"✗ Error compressing {input_path}: {e.stderr}")
+        result['error'] = e.stderr
+        if _cancelled.is_set():
+            result['error'] = 'cancelled'
+            print(f"⏹ Cancelled {os.path.basename(input_path)}")
+        else:
+            print(f"✗ Error compressing {input_path}: {e.stderr}")
     except Exception as e:
+        result['error'] = str(e)
         print(f"✗ Error processing {input_path}: {str(e)}")
+    finally:
+        if not result['success'] and os.path.exists(partial_path):
+            # Don't leave a partial encode behind (also on Ctrl-C)
+            os.remove(partial_path)
+
+    result['wall_time'] = time.monotonic() - start
+    if result['success'] and result['duration'] and result['wall_time'] > 0:
+        result['speed'] = result['duration'] / result['wall_time']
+    return result
 
-def compress_directory(input_dir, output_dir, bitrate='2M', resolution='1920x1080', crf=23):
+def compress_directory(input_dir, output_dir, bitrate='2M', resolution='1920x1080', crf=23,
+                       jobs=1, threads_per_job=0, probe=False, report_path=None,
+                       progress_interval=5.0, segment_seconds=0, rate_control='capped'):
     """
     Batch compress all videos from input directory to output directory.
+
+    Videos are scheduled largest-first so a big file doesn't start last and
+    leave a long tail. With jobs > 1, that many ffmpeg processes run at once,
+    each limited to threads_per_job threads. With probe, files already within
+    the targets are copied or remuxed instead of re-encoded.
+
+    Every input is probed once for its duration, which drives the live
+    per-file and batch ETA. The probes run on PROBE_THREADS background
+    threads, largest file first, so the first encodes start right away and
+    the batch ETA appears once every file is probed. With report_path, one JSON object per file
+    (wall time, speed, sizes, ratio, action) is appended as JSON Lines.
+
+    With segment_seconds, videos longer than 1.5 * segment_seconds are
+    encoded first, one at a time, each split into segments encoded by `jobs`
+    parallel ffmpeg processes; the remaining files then share the job pool.
+    rate_control is passed to compress_video.
     """
+    # A new batch: an earlier Ctrl-C must not cancel it
+    reset_cancel()
+
     # Supported video extensions
     video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m4v'}
-    
+
     input_path = Path(input_dir)
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
-    
-    compressed_count = 0
-    
+
+    work = []
     for file_path in input_path.rglob('*'):
+        if file_path.name.startswith('.') and '.partial-' in file_path.name:
+            continue  # Left behind by an interrupted run
         if file_path.suffix.lower() in video_extensions:
             rel_path = file_path.relative_to(input_path)
             output_file = output_path / rel_path.with_suffix('.mp4')
+            if _same_file(file_path, output_file):
+                print(f"⚠ Skipping {rel_path}: its output would overwrite the input")
+                continue
             output_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            print(f"Processing: {file_path.name}")
-            compress_video(str(file_path), str(output_file), bitrate, resolution, crf)
-            compressed_count += 1
-    
-    print(f"\n🎉 Completed! Processed {compressed_count} videos.")
+            work.append((file_path.stat().st_size, file_path, output_file))
+    work.sort(key=lambda item: item[0], reverse=True)
+
+    def probe_file(file_path):
+        try:
+            return probe_video(str(file_path))
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            # No ffprobe or unreadable file: progress just has no ETA
+            return None
+
+    tracker = BatchProgress(None, progress_interval)
+    prober = ThreadPoolExecutor(max_workers=PROBE_THREADS)
+    infos = {file_path: prober.submit(probe_file, file_path) for _, file_path, _ in work}
+    probes_left = [len(infos)]
+
+    def probed(_):
+        with tracker.lock:
+            probes_left[0] -= 1
+            if probes_left[0] == 0:
+                futures = [future for future in infos.values() if not future.cancelled()]
+                durations = [future.result() and future.result()['duration'] for future in futures]
+                if len(durations) == len(infos) and all(durations):
+                    tracker.total_duration = sum(durations)
+
+    for future in infos.values():
+        future.add_done_callback(probed)
+    batch_start = time.monotonic()
+
+    def run(file_path, output_file, segment_jobs=1):
+        print(f"Processing: {file_path.name}")
+        info = infos[file_path].result()
+        duration = info['duration'] if info else None
+        result = compress_video(str(file_path), str(output_file), bitrate, resolution, crf,
+                                threads_per_job, probe,
+                                info, tracker.callback(file_path.name, duration),
+                                segment_jobs, segment_seconds or 300, rate_control)
+        tracker.finish(file_path.name, duration)
+        return result
+
+    def is_long(file_path):
+        if not (segment_seconds and jobs > 1):
+            return False
+        # Splitting the work needs the durations, so this waits for the probes
+        info = infos[file_path].result()
+        return bool(info and info['duration'] and info['duration'] > 1.5 * segment_seconds)
+
+    results = []
+    report = open(report_path, 'a') if report_path else None
+
+    def record(result):
+        results.append(result)
+        if report:
+            report.write(json.dumps(result) + '\n')
+            report.flush()
+
+    announced = []
+
+    def cancel(futures=()):
+        # cancel_all sets _cancelled before stopping anything, so interrupted
+        # jobs report 'cancelled' rather than an ffmpeg error
+        if not announced:
+            announced.append(True)
+            print("\n⏹ Cancelling all jobs...")
+        for future in futures:
+            future.cancel()
+        cancel_all()
+
+    try:
+        long_work = [item for item in work if is_long(item[1])]
+        work = [item for item in work if not is_long(item[1])]
+        for _, file_path, output_file in long_work:
+            record(run(file_path, output_file, segment_jobs=jobs))
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = [executor.submit(run, file_path, output_file) for _, file_path, output_file in work]
+            try:
+                for future in as_completed(futures):
+                    record(future.result())
+            except KeyboardInterrupt:
+                # Inside the with block: leaving it waits for the running jobs
+                cancel(futures)
+                raise
+    except KeyboardInterrupt:
+        cancel()
+        raise
+    finally:
+        prober.shutdown(wait=False, cancel_futures=True)
+        if report:
+            report.close()
+
+    failed = sum(1 for r in results if not r['success'])
+    wall = time.monotonic() - batch_start
+    print(f"\n🎉 Completed! Processed {len(results)} videos ({failed} failed) in {_format_eta(wall)}.")
+    media = sum(r['duration'] or 0 for r in results if r['success'])
+    if media and wall > 0:
+        print(f"   Throughput: {media / wall:.2f}x realtime")
+    if probe:
+        for action in ('skip', 'remux', 'encode'):
+            count = sum(1 for r in results if r['success'] and r['action'] == action)
+            print(f"   {action}: {count}")
+    return results
 
 def main():
     parser = argparse.ArgumentParser(description="Compress videos with high quality using FFmpeg")
     parser.add_argument("input_dir", help="Input directory containing videos")
     parser.add_argument("output_dir", help="Output directory for compressed videos")
-    parser.add_argument("-b", "--bitrate", default='2M', help="Video bitrate (default: 2M)")
-    parser.add_argument("-r", "--resolution", default='1920x1080', 
+    parser.add_argument("-b", "--bitrate", default='2M',
+                       help="Video bitrate: cap for 'capped', average for '2pass' (default: 2M)")
+    parser.add_argument("-r", "--resolution", default='1920x1080',
                        help="Output resolution (default: 1920x1080)")
-    parser.add_argument("-c", "--crf", type=int, default=23, 
+    parser.add_argument("-c", "--crf", type=int, default=23,
                        help="Quality (18-28, lower=better, default: 23)")
-    
+    parser.add_argument("--rate-control", choices=RATE_CONTROL_MODES, default='capped',
+                       help="crf = quality only, capped = CRF limited to the bitrate, "
+                            "2pass = two-pass average bitrate (default: capped)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                       help="Number of ffmpeg encodes to run at once (default: 1)")
+    parser.add_argument("-t", "--threads-per-job", type=int, default=0,
+                       help="Threads per ffmpeg job (default: CPU count / jobs; 0 with -j 1 = ffmpeg default)")
+    parser.add_argument("-p", "--probe", action="store_true",
+                       help="Probe inputs with ffprobe and skip/remux/partially re-encode when possible")
+    parser.add_argument("--segment-seconds", type=int, default=0,
+                       help="With -j > 1, split videos longer than 1.5x this many seconds into "
+                            "segments encoded in parallel (default: 0 = off)")
+    parser.add_argument("--report", help="Append a JSON line per file (wall time, speed, sizes, ratio) to this file")
+    parser.add_argument("--progress-interval", type=float, default=5.0,
+                       help="Seconds between live progress lines (default: 5)")
+
     args = parser.parse_args()
-    
+    threads_per_job = args.threads_per_job
+    if not threads_per_job and args.jobs > 1:
+        # Split the cores evenly so the jobs together stay within the machine
+        threads_per_job = max(1, (os.cpu_count() or 1) // args.jobs)
+
     print("🚀 High-Quality Video Compressor")
     print(f"Input:  {args.input_dir}")
     print(f"Output: {args.output_dir}")
-    print(f"Settings: {args.resolution} @ {args.bitrate} (CRF {args.crf})")
+    if args.rate_control == '2pass':
+        print(f"Settings: {args.resolution} @ {args.bitrate} (two-pass)")
+    elif args.rate_control == 'capped':
+        print(f"Settings: {args.resolution} @ CRF {args.crf}, capped at {args.bitrate}")
+    else:
+        print(f"Settings: {args.resolution} @ CRF {args.crf} (bitrate not limited)")
+    if args.jobs > 1 or threads_per_job:
+        print(f"Jobs: {args.jobs} x {threads_per_job or 'auto'} threads")
     print("-" * 60)
-    
-    compress_directory(args.input_dir, args.output_dir, args.bitrate, args.resolution, args.crf)
+
+    try:
+        compress_directory(args.input_dir, args.output_dir, args.bitrate, args.resolution, args.crf,
+                           args.jobs, threads_per_job, args.probe, args.report,
+                           args.progress_interval, args.segment_seconds, args.rate_control)
+    except KeyboardInterrupt:
+        print("Cancelled.")
+        raise SystemExit(130)
 
 if __name__ == "__main__":
     main()
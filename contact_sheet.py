@@ -0,0 +1,212 @@
+import argparse
+import html
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from category_manifest import read_manifest, scan_categories
+from embedding_cache import RowCache, content_hash
+from face_store import FaceStore
+
+THUMBNAIL_CACHE_NAME = '.thumbnails'
+
+# Layout defaults: thumbnail side (px), faces shown per category, categories per page
+THUMB_SIZE = 64
+FACES_PER_CATEGORY = 4
+COLUMNS = 10
+ROWS = 8
+
+# Height of the label band under each category, white space between categories
+LABEL_HEIGHT = 16
+CELL_GAP = 8
+
+# imdecode modes tried for thumbnails, cheapest first: JPEG decodes at 1/4 or
+# 1/2 scale skip most of the IDCT work
+_DECODE_FLAGS = (cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_COLOR)
+
+def _thumbnail(data, thumb_size):
+    """Decode crop bytes into a thumb_size x thumb_size BGR thumbnail (None if undecodable)."""
+    data = np.frombuffer(data, np.uint8)
+    for flag in _DECODE_FLAGS:
+        # Use the smallest decode that is still at least thumb_size on both sides
+        image = cv2.imdecode(data, flag)
+        if image is None or min(image.shape[:2]) >= thumb_size:
+            break
+    if image is None:
+        image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if image is None:
+            return None
+    return cv2.resize(image, (thumb_size, thumb_size), interpolation=cv2.INTER_AREA)
+
+class ThumbnailCache(RowCache):
+    """RowCache of uint8 BGR thumbnails ({tag}.u8), keyed by crop content and thumbnail size."""
+
+    suffix = 'u8'
+
+    def __init__(self, cache_dir, thumb_size):
+        super().__init__(cache_dir, {'thumbnail': thumb_size}, (thumb_size, thumb_size, 3), np.uint8)
+
+def load_thumbnails(entries, read_bytes, thumb_size=THUMB_SIZE, cache_dir=None, threads=8):
+    """
+    Return a thumbnail (or None) for every manifest entry.
+
+    Crops are read and decoded on threads (imdecode and resize release the
+    GIL); with cache_dir, thumbnails are kept in a ThumbnailCache so later
+    renders (e.g. after reclustering) only decode crops they have not seen.
+
+    Returns:
+        tuple: (thumbnails, number served from the cache)
+    """
+    cache = ThumbnailCache(cache_dir, thumb_size) if cache_dir is not None else None
+
+    def load(batch):
+        results = []
+        for entry in batch:
+            data = bytes(read_bytes(entry))
+            sha256 = content_hash(data) if cache is not None else None
+            if sha256 is not None and sha256 in cache:
+                results.append((sha256, cache.get(sha256)))
+            else:
+                results.append((sha256, _thumbnail(data, thumb_size)))
+        return results
+
+    thumbnails, cached = [], 0
+    # Entries go to the threads in batches, as most cached loads take microseconds
+    batches = [entries[start:start + 256] for start in range(0, len(entries), 256)]
+    with ThreadPoolExecutor(max(1, threads)) as executor:
+        for results in executor.map(load, batches):
+            new = {}
+            for sha256, thumbnail in results:
+                if cache is not None:
+                    if sha256 in cache:
+                        cached += 1
+                    else:
+                        new[sha256] = thumbnail
+                thumbnails.append(thumbnail)
+            if new:
+                cache.put_many(new.items())
+    return thumbnails, cached
+
+def _cell_layout(faces_per_category, thumb_size):
+    """Return (grid columns, grid rows, cell width, cell height) of one category cell."""
+    grid_columns = math.ceil(math.sqrt(faces_per_category))
+    grid_rows = math.ceil(faces_per_category / grid_columns)
+    return grid_columns, grid_rows, grid_columns * thumb_size + CELL_GAP, grid_rows * thumb_size + LABEL_HEIGHT
+
+def render_contact_sheets(manifest, output_dir, thumb_size=THUMB_SIZE, faces_per_category=FACES_PER_CATEGORY,
+                          columns=COLUMNS, rows=ROWS, cache_dir=None, html_index=True, category_dir=None,
+                          image_format='jpg', threads=8):
+    """
+    Render the categories of a manifest as paged contact sheets.
+
+    Each category is a cell with up to faces_per_category thumbnails and a
+    "category (faces)" label; pages hold columns x rows cells and are
+    NumPy mosaics written straight with cv2.imwrite, so nothing blocks on
+    a display and every category appears on some page. Only the shown
+    faces are decoded.
+
+    Args:
+        manifest (dict): Category manifest (see category_manifest.build_manifest)
+        output_dir (str): Directory for page_NNNN.{image_format} (and index.html)
+        cache_dir (str): Thumbnail cache directory (default: none)
+        html_index (bool): Also write index.html with the pages and a
+            clickable area per category
+        category_dir (str): Folder holding the category_N folders the HTML
+            areas link to (default: no links)
+
+    Returns:
+        list: Paths of the written pages
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    store = FaceStore(manifest['face_dir']) if manifest['store'] else None
+    records = {record['name']: record for record in store} if store is not None else {}
+
+    def read_bytes(entry):
+        if entry['path'] is None:
+            return store.data(records[entry['crop']])
+        return Path(entry['path']).read_bytes()
+
+    categories = list(manifest['categories'].items())
+    shown = [entries[:faces_per_category] for _, entries in categories]
+    thumbnails, cached = load_thumbnails([entry for entries in shown for entry in entries], read_bytes,
+                                         thumb_size, cache_dir, threads)
+
+    grid_columns, _, cell_width, cell_height = _cell_layout(faces_per_category, thumb_size)
+    per_page = columns * rows
+    pages, areas = [], []
+    position = 0
+    for page_start in range(0, len(categories), per_page):
+        page_categories = categories[page_start:page_start + per_page]
+        page_rows = math.ceil(len(page_categories) / columns)
+        page = np.full((page_rows * cell_height, min(columns, len(page_categories)) * cell_width, 3), 255, np.uint8)
+        page_areas = []
+        for slot, (category, entries) in enumerate(page_categories):
+            x0, y0 = (slot % columns) * cell_width, (slot // columns) * cell_height
+            count = len(shown[page_start + slot])
+            for i, thumbnail in enumerate(thumbnails[position:position + count]):
+                if thumbnail is not None:
+                    x, y = x0 + (i % grid_columns) * thumb_size, y0 + (i // grid_columns) * thumb_size
+                    page[y:y + thumb_size, x:x + thumb_size] = thumbnail
+            position += count
+            cv2.putText(page, f"{category} ({len(entries)})", (x0 + 2, y0 + cell_height - 4),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1, cv2.LINE_AA)
+            page_areas.append((category, len(entries), (x0, y0, x0 + cell_width - CELL_GAP, y0 + cell_height)))
+        path = os.path.join(output_dir, f"page_{len(pages) + 1:04d}.{image_format}")
+        cv2.imwrite(path, page)
+        pages.append(path)
+        areas.append(page_areas)
+
+    if html_index:
+        write_html_index(output_dir, pages, areas, category_dir)
+    print(f"Rendered {len(categories)} categories on {len(pages)} pages in '{output_dir}' "
+          f"({cached} of {len(thumbnails)} thumbnails from the cache)")
+    return pages
+
+def write_html_index(output_dir, pages, areas, category_dir=None):
+    """Write output_dir/index.html showing every page with an image map area per category."""
+    lines = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>Face categories</title></head><body>',
+             f'<h1>{sum(len(page_areas) for page_areas in areas)} face categories</h1>']
+    for number, (path, page_areas) in enumerate(zip(pages, areas), 1):
+        lines.append(f'<h2>Page {number}</h2>')
+        lines.append(f'<img src="{html.escape(os.path.basename(path))}" usemap="#page{number}">')
+        lines.append(f'<map name="page{number}">')
+        for category, count, (x0, y0, x1, y1) in page_areas:
+            title = html.escape(f"Category {category} ({count} faces)")
+            href = ''
+            if category_dir is not None:
+                target = os.path.relpath(os.path.join(category_dir, f"category_{category}"), output_dir)
+                href = f' href="{html.escape(target)}/"'
+            lines.append(f'<area shape="rect" coords="{x0},{y0},{x1},{y1}" title="{title}"{href}>')
+        lines.append('</map>')
+    lines.append('</body></html>')
+    with open(os.path.join(output_dir, 'index.html'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render contact sheets of face categories.")
+    parser.add_argument("categories", help="Category directory (with manifest.json or category_N folders)")
+    parser.add_argument("--output", "-o", default=None, help="Output directory (default: CATEGORIES/contact_sheets)")
+    parser.add_argument("--thumb-size", type=int, default=THUMB_SIZE, help=f"Thumbnail size (default: {THUMB_SIZE})")
+    parser.add_argument("--per-category", type=int, default=FACES_PER_CATEGORY,
+                        help=f"Faces shown per category (default: {FACES_PER_CATEGORY})")
+    parser.add_argument("--columns", type=int, default=COLUMNS, help=f"Categories per row (default: {COLUMNS})")
+    parser.add_argument("--rows", type=int, default=ROWS, help=f"Rows per page (default: {ROWS})")
+    parser.add_argument("--format", choices=("jpg", "png"), default="jpg", help="Page image format (default: jpg)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not cache thumbnails")
+    parser.add_argument("--no-html", action="store_true", help="Do not write index.html")
+
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.categories):
+        print(f"Error: {args.categories} is not a valid directory.")
+        exit(1)
+
+    output_dir = args.output or os.path.join(args.categories, "contact_sheets")
+    manifest = read_manifest(args.categories) or scan_categories(args.categories)
+    render_contact_sheets(manifest, output_dir, args.thumb_size, args.per_category, args.columns, args.rows,
+                          None if args.no_cache else os.path.join(args.categories, THUMBNAIL_CACHE_NAME),
+                          not args.no_html, args.categories, args.format)
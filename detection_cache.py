@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import cv2
+
+CACHE_NAME = '.face_detections.sqlite'
+
+# Open caches by (process, thread, path): SQLite connections are never shared
+_open_caches = {}
+
+def default_cache_path(directory_path):
+    """Return the cache sidecar path for an input directory."""
+    return os.path.join(directory_path, CACHE_NAME)
+
+def config_key(config):
+    """
+    Return the canonical cache key of a detector configuration.
+
+    config is a JSON-serializable dict of everything that changes the
+    detections (cascades, detectMultiScale parameters, preprocessing,
+    filter thresholds); the OpenCV version is added because cascade output
+    can differ between releases.
+    """
+    return json.dumps(dict(config, opencv=cv2.__version__), sort_keys=True, separators=(',', ':'))
+
+def _file_sha256(path, chunk_size=1024 * 1024):
+    """Return the hex SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class DetectionCache:
+    """
+    SQLite store of face detections keyed by image content and detector config.
+
+    Two tables: files maps a path's (size, mtime_ns) to its content SHA-256
+    so unchanged files are not re-read, and detections maps
+    (sha256, config key) to the JSON detection entry (raw boxes, candidate
+    boxes and their filter decisions). Because entries are keyed by content,
+    renamed or copied images and new output directories still hit the cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60)
+        # WAL lets parallel workers read while one of them writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS detections ('
+            'sha256 TEXT, config TEXT, entry TEXT, PRIMARY KEY (sha256, config))')
+        self.connection.commit()
+
+    def file_hash(self, file_path):
+        """Return the content SHA-256 of file_path, hashing only new or changed files."""
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        row = self.connection.execute('SELECT size, mtime_ns, sha256 FROM files WHERE path = ?',
+                                      (file_path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        sha256 = _file_sha256(file_path)
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                    (file_path, stat.st_size, stat.st_mtime_ns, sha256))
+        return sha256
+
+    def get(self, sha256, key):
+        """Return the cached entry for (sha256, config key), or None."""
+        row = self.connection.execute('SELECT entry FROM detections WHERE sha256 = ? AND config = ?',
+                                      (sha256, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, sha256, key, entry):
+        """Store a JSON-serializable detection entry."""
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO detections VALUES (?, ?, ?)',
+                                    (sha256, key, json.dumps(entry, separators=(',', ':'))))
+
+    def close(self):
+        self.connection.close()
+
+def open_cache(path):
+    """Return this thread's DetectionCache for path, opening it on first use."""
+    key = (os.getpid(), threading.get_ident(), os.path.abspath(path))
+    if key not in _open_caches:
+        _open_caches[key] = DetectionCache(path)
+    return _open_caches[key]
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+CACHE_NAME = '.face_embeddings'
+ENCODING_SIZE = 128
+
+def default_cache_path(face_dir):
+    """Return the embedding cache directory for a face directory or store."""
+    return os.path.join(face_dir, CACHE_NAME)
+
+def content_hash(data):
+    """Return the hex SHA-256 of encoded crop bytes (bytes or a uint8 array, e.g. a face store view)."""
+    return hashlib.sha256(memoryview(data)).hexdigest()
+
+class RowCache:
+    """
+    Append-only store of fixed-shape arrays keyed by crop content.
+
+    Every setting (encoder model, thumbnail size, ...) gets its own pair of
+    files named by a hash of the settings: {tag}.bin holds one row_shape
+    array of dtype per crop and {tag}.jsonl maps each row to the crop's
+    content hash ({tag}.json records the settings). Crops without a result
+    (no face found, undecodable) get a row of -1 in the index and no data
+    row, so they are not recomputed either. Rows are written before their
+    index line, so an interrupted run never indexes a partial row.
+
+    The data file is memory-mapped read-only on load; get() returns views of it.
+    """
+
+    suffix = 'bin'
+
+    def __init__(self, cache_dir, settings, row_shape, dtype):
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        key = json.dumps(settings, sort_keys=True, separators=(',', ':'))
+        tag = hashlib.sha256(key.encode()).hexdigest()[:16]
+        self.row_shape = tuple(row_shape)
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = int(np.prod(self.row_shape)) * self.dtype.itemsize
+        self.matrix_path = os.path.join(cache_dir, f"{tag}.{self.suffix}")
+        self.index_path = os.path.join(cache_dir, f"{tag}.jsonl")
+        settings_path = os.path.join(cache_dir, f"{tag}.json")
+        if not os.path.exists(settings_path):
+            with open(settings_path, 'w') as f:
+                f.write(key + '\n')
+
+        self.rows = {}
+        count = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.rows[entry['sha256']] = entry['row']
+                        count = max(count, entry['row'] + 1)
+        self.count = count
+        self.matrix = (np.memmap(self.matrix_path, dtype=self.dtype, mode='r', shape=(count,) + self.row_shape)
+                       if count else np.empty((0,) + self.row_shape, self.dtype))
+        self._added = []
+
+    def __contains__(self, sha256):
+        return sha256 in self.rows
+
+    def get(self, sha256):
+        """Return the cached row (a view), None for a crop without a result."""
+        row = self.rows[sha256]
+        if row < 0:
+            return None
+        if row >= len(self.matrix):
+            # Added since the matrix was mapped
+            return self._added[row - len(self.matrix)]
+        return self.matrix[row]
+
+    def put(self, sha256, value):
+        """Append the row of a crop (None when it has no result)."""
+        self.put_many([(sha256, value)])
+
+    def put_many(self, items):
+        """Append the rows of (sha256, value or None) pairs, opening the files once."""
+        index_lines = []
+        with open(self.matrix_path, 'ab') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() != self.count * self.row_bytes:
+                # Drop the partial row of an interrupted run
+                f.truncate(self.count * self.row_bytes)
+            for sha256, value in items:
+                row = -1
+                if value is not None:
+                    value = np.asarray(value, dtype=self.dtype).reshape(self.row_shape)
+                    f.write(value.tobytes())
+                    row = self.count
+                    self.count += 1
+                    self._added.append(value)
+                index_lines.append(json.dumps({'sha256': sha256, 'row': row}) + '\n')
+                self.rows[sha256] = row
+        with open(self.index_path, 'a') as f:
+            f.writelines(index_lines)
+
+class EmbeddingCache(RowCache):
+    """
+    RowCache of face encodings: one float32 ENCODING_SIZE row per crop
+    ({tag}.f32), keyed by crop content and the encoder settings (model,
+    num_jitters, face location mode).
+    """
+
+    suffix = 'f32'
+
+    def __init__(self, cache_dir, settings):
+        super().__init__(cache_dir, settings, (ENCODING_SIZE,), np.float32)
@@ -0,0 +1,321 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import face_extractor
+from face_extractor import IMAGE_EXTENSIONS
+from improved_face_extractor import (FAST_PRESET, box_iou, find_faces, load_cascades, save_face_crops,
+                                     stage_timer)
+
+ANNOTATIONS_NAME = 'annotations.json'
+
+# Detector configurations the benchmark knows: 'basic' is face_extractor's
+# single frontal cascade, the others run improved_face_extractor.find_faces
+BENCH_CONFIGS = {
+    'basic': {'detector': 'basic'},
+    'improved': {'detector': 'improved'},
+    'fast': dict(FAST_PRESET, detector='improved'),
+}
+
+def load_annotations(path):
+    """
+    Load a box annotation file.
+
+    The file is JSON mapping image file names (relative to the image
+    directory) to lists of [x, y, w, h] face boxes. Images that are not
+    listed are treated as unlabelled and left out of precision / recall.
+    """
+    with open(path) as f:
+        annotations = json.load(f)
+    return {name: [tuple(int(v) for v in box) for box in boxes] for name, boxes in annotations.items()}
+
+def _draw_face(size, rng):
+    """Draw a schematic frontal face (skin oval, brows, eyes, nose, mouth) that Haar cascades detect"""
+    face = np.empty((size, size, 3), dtype=np.uint8)
+    face[:] = rng.integers(40, 90, 3)
+    skin = (int(rng.integers(100, 140)), int(rng.integers(135, 165)), int(rng.integers(190, 230)))
+    center = size // 2
+    cv2.ellipse(face, (center, int(size * 0.52)), (int(size * 0.47), int(size * 0.55)), 0, 0, 360, skin, -1)
+    for side in (-1, 1):
+        eye_x, eye_y = center + side * int(size * 0.18), int(size * 0.42)
+        cv2.ellipse(face, (eye_x, eye_y - int(size * 0.09)), (int(size * 0.11), int(size * 0.025)),
+                    0, 180, 360, (40, 50, 70), -1)
+        cv2.ellipse(face, (eye_x, eye_y), (int(size * 0.085), int(size * 0.045)), 0, 0, 360, (235, 235, 240), -1)
+        cv2.circle(face, (eye_x, eye_y), int(size * 0.04), (40, 30, 30), -1)
+    cv2.ellipse(face, (center, int(size * 0.62)), (int(size * 0.05), int(size * 0.03)), 0, 0, 360,
+                (skin[0] - 30, skin[1] - 40, skin[2] - 45), -1)
+    cv2.ellipse(face, (center, int(size * 0.76)), (int(size * 0.14), int(size * 0.04)), 0, 0, 360,
+                (70, 70, 150), -1)
+    return cv2.GaussianBlur(face, (0, 0), max(0.5, size * 0.02))
+
+def generate_synthetic_set(output_dir, count=20, image_size=(1600, 1200), max_faces=6, faces_from=None, seed=0):
+    """
+    Write a labelled synthetic image set plus its annotations.json.
+
+    Each image is a blurred-noise background with 1..max_faces
+    non-overlapping faces at random sizes (40-400 px). Faces are schematic
+    drawings, or random images from faces_from (e.g. real face crops) when
+    given, so the set needs no downloads and is reproducible from seed.
+
+    Returns:
+        dict: The annotations that were written
+    """
+    rng = np.random.default_rng(seed)
+    width, height = image_size
+    sources = []
+    if faces_from:
+        sources = [os.path.join(faces_from, name) for name in sorted(os.listdir(faces_from))
+                   if Path(name).suffix.lower() in IMAGE_EXTENSIONS]
+        if not sources:
+            raise ValueError(f"No face images in {faces_from}")
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    annotations = {}
+    for index in range(count):
+        noise = rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+        image = cv2.resize(cv2.GaussianBlur(noise, (0, 0), 1.5), (width, height), interpolation=cv2.INTER_CUBIC)
+        boxes = []
+        for _ in range(int(rng.integers(1, max_faces + 1))):
+            # Try a few placements, skipping faces that would overlap earlier ones
+            for _ in range(20):
+                size = int(rng.integers(40, min(400, width, height) + 1))
+                box = (int(rng.integers(0, width - size + 1)), int(rng.integers(0, height - size + 1)), size, size)
+                if all(box_iou(box, other) == 0 for other in boxes):
+                    break
+            else:
+                continue
+            if sources:
+                face = cv2.imread(sources[int(rng.integers(len(sources)))])
+                face = cv2.resize(face, (size, size), interpolation=cv2.INTER_AREA)
+            else:
+                face = _draw_face(size, rng)
+            x, y = box[:2]
+            image[y:y+size, x:x+size] = face
+            boxes.append(box)
+        name = f"synthetic_{index:04d}.jpg"
+        cv2.imwrite(os.path.join(output_dir, name), image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+        annotations[name] = [list(box) for box in boxes]
+
+    with open(os.path.join(output_dir, ANNOTATIONS_NAME), 'w') as f:
+        json.dump(annotations, f, indent=1)
+    return annotations
+
+def match_detections(detections, truths, iou=0.5):
+    """
+    Greedily match detections (best score first) to ground-truth boxes.
+
+    Args:
+        detections (list): (box, score) pairs
+        truths (list): Ground-truth boxes
+        iou (float): Minimum IoU for a match
+
+    Returns:
+        tuple: (true positives, false positives, false negatives)
+    """
+    unmatched = list(truths)
+    true_positives = 0
+    for box, _ in sorted(detections, key=lambda detection: -detection[1]):
+        overlaps = [box_iou(box, truth) for truth in unmatched]
+        if overlaps and max(overlaps) >= iou:
+            unmatched.pop(int(np.argmax(overlaps)))
+            true_positives += 1
+    return true_positives, len(detections) - true_positives, len(unmatched)
+
+def _bench_config(directory, names, annotations, config, iou):
+    """Run one configuration over the images (in a fresh process) and return its measurements"""
+    options = dict(config)
+    detector = options.pop('detector')
+    cascade_names = options.pop('cascade_names', None)
+
+    start = time.perf_counter()
+    if detector == 'basic':
+        cascade = face_extractor.load_face_cascade()
+    else:
+        cascades = load_cascades(cascade_names)
+    load_seconds = time.perf_counter() - start
+
+    timings = {}
+    faces_found = 0
+    megapixels = 0.0
+    true_positives = false_positives = false_negatives = 0
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        for name in names:
+            with stage_timer(timings, 'imread'):
+                image = cv2.imread(os.path.join(directory, name))
+            if image is None:
+                continue
+            megapixels += image.shape[0] * image.shape[1] / 1e6
+            stem = Path(name).stem
+
+            if detector == 'basic':
+                with stage_timer(timings, 'frontal'):
+                    boxes = face_extractor.detect_faces(image, cascade)
+                with stage_timer(timings, 'imwrite'):
+                    face_extractor.save_faces(image, boxes, stem, output_dir, verbose=False)
+                detections = [(tuple(int(v) for v in box), 1.0) for box in boxes]
+            else:
+                faces = find_faces(image, cascades, verbose=False, timings=timings, **options)
+                save_face_crops(image, faces, stem, output_dir, verbose=False, timings=timings)
+                detections = [(face['box'], face['score']) for face in faces]
+
+            faces_found += len(detections)
+            if name in annotations:
+                tp, fp, fn = match_detections(detections, annotations[name], iou)
+                true_positives += tp
+                false_positives += fp
+                false_negatives += fn
+        seconds = time.perf_counter() - start
+
+    accuracy = None
+    if any(name in annotations for name in names):
+        found = true_positives + false_positives
+        labelled = true_positives + false_negatives
+        accuracy = {
+            'true_positives': true_positives,
+            'false_positives': false_positives,
+            'false_negatives': false_negatives,
+            'precision': true_positives / found if found else 0.0,
+            'recall': true_positives / labelled if labelled else 0.0,
+        }
+
+    return {
+        'config': config,
+        'images': len(names),
+        'faces_found': faces_found,
+        'load_seconds': load_seconds,
+        'seconds': seconds,
+        'images_per_second': len(names) / seconds if seconds else 0.0,
+        'megapixels_per_second': megapixels / seconds if seconds else 0.0,
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stages': {stage: {'seconds': value, 'ms_per_image': 1000 * value / len(names) if names else 0.0,
+                           'share': value / seconds if seconds else 0.0}
+                   for stage, value in sorted(timings.items(), key=lambda item: -item[1])},
+        'accuracy': accuracy,
+    }
+
+def _git_commit():
+    """Return the current git commit of this checkout, or None outside a git repository"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               cwd=os.path.dirname(os.path.abspath(__file__)),
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() + ('-dirty' if dirty else '')
+
+def run_benchmark(directory, config_names=None, annotations_path=None, iou=0.5):
+    """
+    Benchmark detector configurations over an image directory.
+
+    Each configuration runs in its own fresh process so that its peak memory
+    (ru_maxrss) is not inflated by the ones before it. Crops are written to
+    a temporary directory so imwrite is part of the measurement.
+
+    Args:
+        directory (str): Image directory
+        config_names (list): BENCH_CONFIGS names (default: all)
+        annotations_path (str): Box annotations (default: directory/annotations.json if present)
+        iou (float): IoU threshold for precision / recall
+
+    Returns:
+        dict: JSON-serializable report (commit, dataset, per-configuration results)
+    """
+    config_names = config_names or list(BENCH_CONFIGS)
+    annotations_path = annotations_path or os.path.join(directory, ANNOTATIONS_NAME)
+    annotations = load_annotations(annotations_path) if os.path.exists(annotations_path) else {}
+    names = sorted(name for name in os.listdir(directory) if Path(name).suffix.lower() in IMAGE_EXTENSIONS)
+
+    report = {
+        'commit': _git_commit(),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'dataset': os.path.abspath(directory),
+        'annotations': os.path.abspath(annotations_path) if annotations else None,
+        'images': len(names),
+        'labelled_images': sum(1 for name in names if name in annotations),
+        'iou_threshold': iou,
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'results': {},
+    }
+    context = multiprocessing.get_context('spawn')
+    for config_name in config_names:
+        print(f"Running {config_name} on {len(names)} images...")
+        with context.Pool(1) as pool:
+            report['results'][config_name] = pool.apply(
+                _bench_config, (directory, names, annotations, BENCH_CONFIGS[config_name], iou))
+    return report
+
+def print_report(report):
+    """Print the summary and per-stage tables of a benchmark report"""
+    print(f"\n{report['images']} images ({report['labelled_images']} labelled), "
+          f"IoU {report['iou_threshold']}, commit {report['commit'] or 'unknown'}")
+    print(f"{'Config':<10} {'Time':>8} {'img/s':>7} {'MP/s':>7} {'Peak MB':>8} {'Faces':>6} "
+          f"{'Precision':>9} {'Recall':>7}")
+    for name, result in report['results'].items():
+        accuracy = result['accuracy']
+        precision = f"{accuracy['precision']:.1%}" if accuracy else '-'
+        recall = f"{accuracy['recall']:.1%}" if accuracy else '-'
+        print(f"{name:<10} {result['seconds']:>7.2f}s {result['images_per_second']:>7.2f} "
+              f"{result['megapixels_per_second']:>7.1f} {result['peak_rss_mb']:>8.0f} "
+              f"{result['faces_found']:>6} {precision:>9} {recall:>7}")
+
+    for name, result in report['results'].items():
+        print(f"\n{name} stages (ms per image):")
+        for stage, timing in result['stages'].items():
+            print(f"  {stage:<28} {timing['ms_per_image']:>9.1f} {timing['share']:>6.1%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark face detector configurations (latency, memory, precision/recall).")
+    parser.add_argument("directory", help="Image directory (with annotations.json for precision/recall)")
+    parser.add_argument("--annotations", "-a", default=None,
+                        help=f"Box annotation JSON {{image: [[x, y, w, h], ...]}} (default: directory/{ANNOTATIONS_NAME})")
+    parser.add_argument("--configs", "-c", default=','.join(BENCH_CONFIGS),
+                        help=f"Comma-separated configurations to run (default: {','.join(BENCH_CONFIGS)})")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU threshold for a correct detection (default: 0.5)")
+    parser.add_argument("--output", "-o", default=None, help="Write the JSON report to this file")
+    synthetic = parser.add_argument_group("synthetic set")
+    synthetic.add_argument("--generate", type=int, default=0, metavar="N",
+                           help="First write N labelled synthetic images (and annotations.json) into directory")
+    synthetic.add_argument("--faces-from", default=None,
+                           help="Paste face images from this directory instead of drawing schematic faces")
+    synthetic.add_argument("--image-size", default="1600x1200", help="Synthetic image size WxH (default: 1600x1200)")
+    synthetic.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic set (default: 0)")
+
+    args = parser.parse_args()
+
+    config_names = [name.strip() for name in args.configs.split(',') if name.strip()]
+    unknown = [name for name in config_names if name not in BENCH_CONFIGS]
+    if unknown:
+        parser.error(f"unknown config: {', '.join(unknown)}")
+
+    if args.generate:
+        width, height = (int(v) for v in args.image_size.lower().split('x'))
+        generate_synthetic_set(args.directory, args.generate, (width, height),
+                               faces_from=args.faces_from, seed=args.seed)
+        print(f"Generated {args.generate} synthetic images in {args.directory}")
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: {args.directory} is not a valid directory.")
+        exit(1)
+
+    report = run_benchmark(args.directory, config_names, args.annotations, args.iou)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
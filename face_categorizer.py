@@ -1,64 +1,86 @@
 import argparse
 import cv2
 import os
-import re
-import shutil
+import time
 import numpy as np
 from pathlib import Path
-import face_recognition
 from sklearn.cluster import DBSCAN
 from sklearn.decomposition import PCA
-import matplotlib.pyplot as plt
 
-def extract_faces_from_directory(directory_path, output_dir):
-    """Extract faces from images (same as before)"""
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    Path(output_dir).mkdir(parents=True, exist_ok=True)
-    image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff'}
-    
-    face_files = []
-    
-    for image_file in os.listdir(directory_path):
-        if Path(image_file).suffix.lower() in image_extensions:
-            image_path = os.path.join(directory_path, image_file)
-            image = cv2.imread(image_path)
-            if image is None:
-                continue
-                
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5, minSize=(30, 30))
-            
-            for i, (x, y, w, h) in enumerate(faces):
-                face_roi = image[y:y+h, x:x+w]
-                output_filename = f"{Path(image_file).stem}_face_{i}.jpg"
-                output_path = os.path.join(output_dir, output_filename)
-                cv2.imwrite(output_path, face_roi)
-                face_files.append(output_path)
-    
-    return face_files
+import face_clustering
+import face_extractor
+from category_manifest import (LINK_MODES, build_manifest, materialize_crops, materialize_sources, read_manifest,
+                               scan_categories, write_manifest)
+from contact_sheet import THUMBNAIL_CACHE_NAME, render_contact_sheets
+from embedding_cache import default_cache_path
+from face_encoding import BATCH_SIZE, FACE_LOCATIONS, MODELS, encode_faces, print_encoding_report
+from face_store import FaceStore, is_face_store
+
+# How categorize_faces clusters the encodings: 'exact' runs DBSCAN over all
+# encodings, 'graph' gets the same labels from a bounded-memory neighbor
+# graph, and 'incremental' keeps earlier categories and only assigns or
+# clusters new faces (face_clustering.cluster_incremental).
+CLUSTERING = ('exact', 'graph', 'incremental')
+
+def extract_faces_from_directory(directory_path, output_dir, every_n=None, fps=None, keyframes_only=False,
+                                 workers=1, cache_path=None, recrop=False, store=False, **pipeline):
+    """Extract faces from images and videos (same as face_extractor, without the log)"""
+    return face_extractor.extract_faces_from_directory(directory_path, output_dir, verbose=False,
+                                                       every_n=every_n, fps=fps,
+                                                       keyframes_only=keyframes_only, workers=workers,
+                                                       cache_path=cache_path, recrop=recrop, store=store,
+                                                       **pipeline)
 
-def categorize_faces(face_dir, min_faces_per_category=2, eps=0.5):
-    """Categorize faces using face embeddings and DBSCAN clustering"""
-    face_files = list(Path(face_dir).glob("*.jpg")) + list(Path(face_dir).glob("*.png"))
+def categorize_faces(face_dir, min_faces_per_category=2, eps=0.5, face_locations='detect', audit=False,
+                     cache_dir=None, clustering='exact', state_path=None, model='small', num_jitters=1,
+                     workers=1, batch_size=BATCH_SIZE, link='hardlink'):
+    """Categorize faces using face embeddings and DBSCAN clustering
+
+    face_dir is a directory of crop files or a face store (see face_store),
+    whose crops are decoded straight from the shards.
+
+    Args:
+        face_locations (str): How faces are located for encoding (see face_encoding.FACE_LOCATIONS);
+            'crop' and 'source' skip the HOG re-detection of the default 'detect'
+        audit (bool): With 'crop' / 'source', also run HOG on every crop and
+            report how many faces the 'detect' path would have dropped
+        cache_dir (str): Embedding cache directory (see embedding_cache); crops
+            already encoded with the same settings are not encoded again
+        clustering (str): 'exact' (DBSCAN over all encodings), 'graph' (the
+            same labels from a chunked neighbor graph) or 'incremental'; see
+            CLUSTERING and face_clustering
+        state_path (str): Category ID state file (see face_clustering.ClusterState);
+            keeps category numbers stable across 'graph' / 'incremental' runs
+        model (str): Landmark model of the encoder, 'small' or 'large'
+        num_jitters (int): Re-samplings averaged per encoding
+        workers (int): Encoder processes (see face_encoding.encode_faces)
+        batch_size (int): Crops sent to an encoder process at a time
+        link (str): How crops are placed in categories/category_N (see
+            category_manifest.LINK_MODES); categories/manifest.json lists them
+
+    Returns:
+        dict: The category manifest, None when there were too few faces
+    """
+    if is_face_store(face_dir):
+        store = FaceStore(face_dir)
+        face_files = store.records
+    else:
+        store = None
+        face_files = list(Path(face_dir).glob("*.jpg")) + list(Path(face_dir).glob("*.png"))
     
     if len(face_files) < min_faces_per_category:
         print("Not enough faces for categorization")
         return
     
     # Extract face encodings
-    encodings = []
-    valid_faces = []
-    
     print("Extracting face encodings...")
-    for face_file in face_files:
-        try:
-            image = face_recognition.load_image_file(face_file)
-            face_encodings = face_recognition.face_encodings(image)
-            if face_encodings:
-                encodings.append(face_encodings[0])
-                valid_faces.append(face_file)
-        except:
-            continue
+    start = time.perf_counter()
+    read_bytes = store.data if store is not None else lambda path: Path(path).read_bytes()
+    face_encodings, report = encode_faces(face_files, read_bytes, face_locations, model, num_jitters, audit,
+                                          workers, batch_size, cache_dir)
+    print_encoding_report(face_encodings, report, time.perf_counter() - start)
+    valid_faces = [face for face, encoding in zip(face_files, face_encodings) if encoding is not None]
+    encodings = [encoding for encoding in face_encodings if encoding is not None]
     
     if len(encodings) < min_faces_per_category:
         print("Not enough valid faces with encodings")
@@ -68,35 +90,48 @@ def categorize_faces(face_dir, min_faces_per_category=2, eps=0.5):
     
     # Cluster faces using DBSCAN
     print("Clustering faces...")
-    clustering = DBSCAN(eps=eps, min_samples=min_faces_per_category, metric='euclidean').fit(encodings)
-    labels = clustering.labels_
-    
-    # Create category directories
-    Path("categories").mkdir(exist_ok=True)
-    
-    # Group faces by category
-    n_categories = len(set(labels)) - (1 if -1 in labels else 0)
+    keys = [face['name'] if isinstance(face, dict) else face.name for face in valid_faces]
+    if clustering == 'exact':
+        labels = DBSCAN(eps=eps, min_samples=min_faces_per_category, metric='euclidean').fit(encodings).labels_
+    elif clustering == 'graph':
+        labels = face_clustering.dbscan(encodings, eps, min_faces_per_category)
+        if state_path is not None:
+            state = face_clustering.ClusterState(state_path)
+            labels = face_clustering.stable_ids(labels, keys, state)
+            state.save()
+    else:
+        state = face_clustering.ClusterState(state_path or face_clustering.default_state_path(face_dir))
+        known = int((state.ids(keys) >= 0).sum())
+        labels = face_clustering.cluster_incremental(encodings, keys, eps, min_faces_per_category, state)
+        state.save()
+        print(f"{known} faces kept their category, {len(keys) - known} new or uncategorized faces re-checked")
+    
+    # Group faces by category (noise points are left out)
+    manifest = build_manifest(valid_faces, labels, face_dir)
+    n_categories = len(manifest['categories'])
     print(f"Found {n_categories} categories")
+    for category, entries in manifest['categories'].items():
+        print(f"Category {category}: {len(entries)} faces")
     
-    for label in set(labels):
-        if label == -1:  # Noise points
-            continue
-            
-        category_dir = Path("categories") / f"category_{label}"
-        category_dir.mkdir(exist_ok=True)
-        
-        category_faces = [f for i, f in enumerate(valid_faces) if labels[i] == label]
-        print(f"Category {label}: {len(category_faces)} faces")
-        
-        for face_file in category_faces:
-            output_path = category_dir / face_file.name
-            cv2.imwrite(str(output_path), cv2.imread(str(face_file)))
+    # Create category directories from the manifest
+    write_manifest(manifest, "categories")
+    counts = materialize_crops(manifest, "categories", link)
+    print("Category crops: " + ", ".join(f"{count} {mode}" for mode, count in counts.items()))
     
     # Visualize categories (optional)
-    visualize_categories(valid_faces, labels, n_categories)
+    render_contact_sheets(manifest, os.path.join("categories", "contact_sheets"),
+                          cache_dir=os.path.join("categories", THUMBNAIL_CACHE_NAME), category_dir="categories")
+    return manifest
+
+def visualize_categories(face_files, labels, n_categories, load_image=None):
+    """Create a visualization of categorized faces
+
+    load_image(face) returns an RGB image (default: read the face file).
+    Interactive and limited to one face of the first few categories;
+    categorize_faces renders contact sheets (see contact_sheet) instead.
+    """
+    import matplotlib.pyplot as plt
 
-def visualize_categories(face_files, labels, n_categories):
-    """Create a visualization of categorized faces"""
     fig, axes = plt.subplots(2, max(3, n_categories//2), figsize=(15, 8))
     axes = axes.ravel()
     
@@ -104,8 +139,10 @@ def visualize_categories(face_files, labels, n_categories):
     for i, label in enumerate(unique_labels[:len(axes)]):
         category_faces = [face_files[j] for j, l in enumerate(labels) if l == label]
         if category_faces:
-            img = cv2.imread(str(category_faces[0]))
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            if load_image is not None:
+                img = load_image(category_faces[0])
+            else:
+                img = cv2.cvtColor(cv2.imread(str(category_faces[0])), cv2.COLOR_BGR2RGB)
             axes[i].imshow(img)
             axes[i].set_title(f'Category {label}\n({len(category_faces)} faces)')
             axes[i].axis('off')
@@ -116,26 +153,17 @@ def visualize_categories(face_files, labels, n_categories):
     print("Visualization saved as 'face_categories.png'")
 
 
-def copy_image_per_category(image_dir, category_dir, copy_dir):
-    """ copy image per category """
-    # Create category directories
-    Path(copy_dir).mkdir(exist_ok=True)
+def copy_image_per_category(image_dir, category_dir, copy_dir, link='hardlink'):
+    """ copy image per category
 
-    # list category path extract images
-    category_imgs = list(Path(category_dir).glob("**/*.jpg")) + list(Path(category_dir).glob("**/*.png"))
-
-    for category_img in category_imgs:
-        img_segments = str(category_img).split('/') # category_dir/category/image
-        
-        # create category directory
-        category_dir = Path(copy_dir) / img_segments[1]
-        category_dir.mkdir(exist_ok=True)
-
-        # prepare image name
-        image_name = re.sub(r'_face_\d+', '', str(img_segments[2]))
-
-        # copy image from source to category directory
-        shutil.copy(Path(f"{image_dir}/{image_name}"), Path(f"{copy_dir}/{img_segments[1]}"))
+    Uses category_dir/manifest.json (written by categorize_faces), or scans
+    the category_N folders when there is none. Each original image is
+    placed once per category, linked when possible (see
+    category_manifest.materialize_sources).
+    """
+    manifest = read_manifest(category_dir) or scan_categories(category_dir)
+    counts = materialize_sources(manifest, copy_dir, image_dir, link)
+    print("Category images: " + ", ".join(f"{count} {mode}" for mode, count in counts.items()))
     
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extract and categorize faces from images.")
@@ -145,23 +173,66 @@ if __name__ == "__main__":
     parser.add_argument("--min-faces", type=int, default=2, help="Minimum faces per category")
     parser.add_argument("--similarity", type=float, default=0.5, help="Similarity threshold (0.3-0.7)")
     parser.add_argument("--copy-dir", "-d", default="copy", help="Output directory for categorized")
+    parser.add_argument("--face-locations", choices=FACE_LOCATIONS, default="detect",
+                        help="Locate faces for encoding by re-running HOG on each crop (detect), taking the whole "
+                             "crop (crop) or the stored box on the original image (source, needs --store)")
+    parser.add_argument("--embedding-cache", nargs="?", const="", default=None, metavar="DIR",
+                        help="Cache face encodings by crop content + encoder settings, so re-clustering with "
+                             "other --similarity / --min-faces values skips encoding (default: OUTPUT/.face_embeddings)")
+    parser.add_argument("--clustering", choices=CLUSTERING, default="exact",
+                        help="Cluster all faces with DBSCAN (exact), the same with a bounded-memory neighbor graph "
+                             "(graph), or only new faces against existing categories (incremental)")
+    parser.add_argument("--cluster-state", default=None, metavar="FILE",
+                        help=f"Category ID state kept across runs (incremental default: "
+                             f"OUTPUT/{face_clustering.STATE_NAME}; with graph, renumbers clusters to match it)")
+    parser.add_argument("--link", choices=LINK_MODES, default="hardlink",
+                        help="How crops and images are placed in category folders; falls back to a copy when "
+                             "the file system does not support it (default: hardlink)")
+    parser.add_argument("--encoder-model", choices=MODELS, default="small",
+                        help="Landmark model used for encoding (large = 68 points, slower)")
+    parser.add_argument("--num-jitters", type=int, default=1,
+                        help="Re-sample each face this many times when encoding (slower, default: 1)")
+    parser.add_argument("--encode-batch", type=int, default=BATCH_SIZE,
+                        help=f"Crops sent to an encoder worker at a time (default: {BATCH_SIZE}); "
+                             f"--workers also sets the number of encoder processes")
+    parser.add_argument("--audit-hog", action="store_true",
+                        help="With --face-locations crop/source, count the crops HOG re-detection would drop")
+    face_extractor.add_sampling_arguments(parser)
+    face_extractor.add_workers_argument(parser)
+    face_extractor.add_cache_arguments(parser)
+    face_extractor.add_pipeline_arguments(parser)
+    face_extractor.add_store_argument(parser)
     
     args = parser.parse_args()
     
     if not os.path.isdir(args.directory):
         print(f"Error: {args.directory} is not a valid directory.")
         exit(1)
+
+    embedding_cache = None
+    if args.embedding_cache is not None:
+        embedding_cache = args.embedding_cache or default_cache_path(args.output)
     
     # Step 1: Extract faces
-    # print("Step 1: Extracting faces...")
-    # face_files = extract_faces_from_directory(args.directory, args.output)
-    # print(f"Extracted {len(face_files)} faces to {args.output}")
+    print("Step 1: Extracting faces...")
+    face_files = extract_faces_from_directory(args.directory, args.output,
+                                              **face_extractor.sampling_options(args),
+                                              workers=face_extractor.workers_option(args),
+                                              **face_extractor.cache_options(args),
+                                              **face_extractor.pipeline_options(args), store=args.store)
+    print(f"Extracted {len(face_files)} faces to {args.output}")
     
     # Step 2: Categorize faces (if requested)
-    # if args.categorize and face_files:
-    #     print("\nStep 2: Categorizing faces...")
-    #     categorize_faces(args.output, args.min_faces, args.similarity)
+    manifest = None
+    if args.categorize and face_files:
+        print("\nStep 2: Categorizing faces...")
+        manifest = categorize_faces(args.output, args.min_faces, args.similarity, args.face_locations,
+                                    args.audit_hog, embedding_cache, args.clustering, args.cluster_state,
+                                    args.encoder_model, args.num_jitters, face_extractor.workers_option(args),
+                                    args.encode_batch, args.link)
 
     # Step 3: Copy files into category
-    # copy_image_per_category(args.directory, 'categories', args.copy_dir)
+    if manifest is not None:
+        print("\nStep 3: Copying images into categories...")
+        copy_image_per_category(args.directory, 'categories', args.copy_dir, args.link)
 
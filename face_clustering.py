@@ -0,0 +1,134 @@
+import json
+import os
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import NearestNeighbors
+
+STATE_NAME = '.face_clusters.json'
+
+# Faces queried per neighbor search (bounds the distance blocks held at once)
+CHUNK_ROWS = 4096
+
+def default_state_path(face_dir):
+    """Return the cluster state sidecar path for a face directory or store."""
+    return os.path.join(face_dir, STATE_NAME)
+
+def radius_neighbors_graph(X, eps, chunk_rows=CHUNK_ROWS):
+    """
+    Return the sparse graph of euclidean distances <= eps between the rows of X.
+
+    Neighbors are queried chunk_rows rows at a time with the radius search
+    DBSCAN(metric='euclidean') runs internally, so the graph holds exactly
+    the neighborhoods it would use, while memory grows with the number of
+    neighbor pairs rather than with len(X) squared. Every row includes
+    itself (an explicit zero), as DBSCAN counts a point in its own
+    neighborhood.
+    """
+    neighbors = NearestNeighbors(radius=eps).fit(X)
+    return sparse.vstack([neighbors.radius_neighbors_graph(X[start:start + chunk_rows], mode='distance')
+                          for start in range(0, len(X), chunk_rows)], format='csr')
+
+def dbscan(X, eps, min_samples, chunk_rows=CHUNK_ROWS):
+    """Return DBSCAN labels of X computed on a radius_neighbors_graph (same labels as the euclidean path)."""
+    if len(X) == 0:
+        return np.empty(0, dtype=int)
+    graph = radius_neighbors_graph(X, eps, chunk_rows)
+    return DBSCAN(eps=eps, min_samples=min_samples, metric='precomputed').fit(graph).labels_
+
+def nearest_exemplars(X, exemplars, chunk_rows=CHUNK_ROWS):
+    """Return (index of the nearest exemplar, its distance) for every row of X, chunk_rows rows at a time."""
+    index = NearestNeighbors(n_neighbors=1).fit(exemplars)
+    distances, nearest = [], []
+    for start in range(0, len(X), chunk_rows):
+        chunk_distances, chunk_nearest = index.kneighbors(X[start:start + chunk_rows])
+        distances.append(chunk_distances[:, 0])
+        nearest.append(chunk_nearest[:, 0])
+    return np.concatenate(nearest), np.concatenate(distances)
+
+class ClusterState:
+    """
+    Category IDs of faces across runs, stored as JSON.
+
+    faces maps a face key (its crop name) to its category ID (-1 = noise);
+    next_id is the first never-used ID, so a category that disappears never
+    has its ID reused for different people.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.faces = {}
+        self.next_id = 0
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.faces = state['faces']
+            self.next_id = state['next_id']
+
+    def ids(self, keys):
+        """Return the stored category IDs of keys (-1 for unknown faces and noise)."""
+        return np.array([self.faces.get(key, -1) for key in keys], dtype=int)
+
+    def update(self, keys, ids):
+        for key, category in zip(keys, ids):
+            self.faces[key] = int(category)
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'next_id': self.next_id, 'faces': self.faces}, f)
+        os.replace(temp_path, self.path)
+
+def stable_ids(labels, keys, state):
+    """
+    Map fresh cluster labels to the category IDs of state and record them.
+
+    Each cluster takes the previous ID most of its faces had, largest
+    overlaps first, each previous ID going to one cluster at most; clusters
+    of new faces (or that lost the vote) get new IDs. Noise stays -1.
+    """
+    previous = state.ids(keys)
+    votes = Counter((label, category) for label, category in zip(labels, previous) if label >= 0 and category >= 0)
+    mapping, taken = {}, set()
+    for (label, category), _ in sorted(votes.items(), key=lambda vote: (-vote[1], vote[0])):
+        if label not in mapping and category not in taken:
+            mapping[label] = category
+            taken.add(category)
+    for label in sorted(set(labels) - {-1} - set(mapping)):
+        mapping[label] = state.next_id
+        state.next_id += 1
+    ids = np.array([mapping.get(label, -1) for label in labels], dtype=int)
+    state.update(keys, ids)
+    return ids
+
+def cluster_incremental(X, keys, eps, min_samples, state, chunk_rows=CHUNK_ROWS):
+    """
+    Assign faces to the categories of state and cluster only what is left.
+
+    Faces with a category keep it. Every other face (new, or noise last
+    time) joins the category of its nearest categorized face when that is
+    within eps; all faces categorized so far act as the exemplar index. The
+    remaining faces are clustered with dbscan and their clusters get new
+    IDs. Earlier faces are never moved, so category IDs (and folders) stay
+    stable; run a full clustering from time to time to merge or split.
+
+    Returns:
+        ndarray: Category ID of every row of X (-1 = noise); state is updated
+    """
+    ids = state.ids(keys)
+    known = ids >= 0
+    pending = np.flatnonzero(~known)
+    if known.any() and len(pending):
+        nearest, distances = nearest_exemplars(X[pending], X[known], chunk_rows)
+        close = distances <= eps
+        ids[pending[close]] = ids[known][nearest[close]]
+
+    rest = np.flatnonzero(ids < 0)
+    labels = dbscan(X[rest], eps, min_samples, chunk_rows)
+    for label in sorted(set(labels) - {-1}):
+        ids[rest[labels == label]] = state.next_id
+        state.next_id += 1
+    state.update(keys, ids)
+    return ids
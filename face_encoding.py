@@ -0,0 +1,238 @@
+import io
+import multiprocessing
+import os
+from collections import Counter, deque
+
+import cv2
+import face_recognition
+import numpy as np
+
+from embedding_cache import EmbeddingCache, content_hash
+from improved_face_extractor import stage_timer
+
+# Where the encoder gets the face location it passes to face_encodings:
+# 'detect' re-runs dlib's HOG detector on every crop (crops it misses are
+# dropped), 'crop' takes the whole crop as the face, and 'source' takes the
+# stored box on the original image plus SOURCE_MARGIN of context (face store
+# records of still images; other crops fall back to 'crop').
+FACE_LOCATIONS = ('detect', 'crop', 'source')
+SOURCE_MARGIN = 0.25
+
+# face_recognition landmark models: 'small' (5 points, default) or 'large' (68 points)
+MODELS = ('small', 'large')
+
+# Crops sent to a worker at a time
+BATCH_SIZE = 32
+
+def encoder_settings(face_locations='detect', model='small', num_jitters=1):
+    """Return the settings that change an encoding (the embedding cache key)."""
+    settings = {'encoder': 'face_recognition', 'model': model, 'num_jitters': num_jitters,
+                'face_locations': face_locations}
+    if face_locations == 'source':
+        settings['margin'] = SOURCE_MARGIN
+    return settings
+
+def _source_face(record, sources, margin=SOURCE_MARGIN):
+    """
+    Return (RGB region of record's source image, [face location in it]) or None.
+
+    The region is the stored box grown by margin on every side (clipped to
+    the image), so the landmark model sees the face in its original context
+    and resolution. sources caches the last decoded source image, since
+    records of one image are adjacent in the store.
+    """
+    if not isinstance(record, dict) or 'box' not in record or 'timestamp' in record:
+        return None
+    source = record.get('source')
+    if source not in sources:
+        sources.clear()
+        sources[source] = cv2.imread(source) if source and os.path.isfile(source) else None
+    image = sources[source]
+    if image is None:
+        return None
+    x, y, w, h = record['box']
+    x0, y0 = max(0, x - int(w * margin)), max(0, y - int(h * margin))
+    x1, y1 = min(image.shape[1], x + w + int(w * margin)), min(image.shape[0], y + h + int(h * margin))
+    region = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+    # face_recognition locations are (top, right, bottom, left)
+    return region, [(y - y0, min(x + w, x1) - x0, min(y + h, y1) - y0, x - x0)]
+
+def _load_crop(face, data):
+    """Decode crop bytes to RGB: face store blobs with OpenCV, files like face_recognition.load_image_file."""
+    if isinstance(face, dict):
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"could not decode {face['name']}")
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return face_recognition.load_image_file(io.BytesIO(data))
+
+def _encode_face(face, data, settings, audit, sources, timings):
+    """
+    Return (float32 encoding or None, whether HOG missed the face) for one crop.
+
+    HOG misses are what the 'detect' path drops; with 'crop' / 'source' they
+    are only checked when audit is set.
+    """
+    face_locations = settings['face_locations']
+    located = None
+    if face_locations == 'source':
+        with stage_timer(timings, 'source'):
+            located = _source_face(face, sources, settings['margin'])
+    image = None
+    if located is None or audit:
+        with stage_timer(timings, 'decode'):
+            image = _load_crop(face, data)
+    hog_missed = False
+    if face_locations != 'detect' and audit:
+        with stage_timer(timings, 'audit'):
+            hog_missed = not face_recognition.face_locations(image)
+
+    options = {'num_jitters': settings['num_jitters'], 'model': settings['model']}
+    with stage_timer(timings, 'encode'):
+        if located is not None:
+            face_encodings = face_recognition.face_encodings(located[0], known_face_locations=located[1],
+                                                             **options)
+        elif face_locations != 'detect':
+            face_encodings = face_recognition.face_encodings(
+                image, known_face_locations=[(0, image.shape[1], image.shape[0], 0)], **options)
+        else:
+            face_encodings = face_recognition.face_encodings(image, **options)
+            hog_missed = not face_encodings
+    # float32, like the embedding cache, so cached and fresh runs cluster identically
+    return (np.asarray(face_encodings[0], dtype=np.float32) if face_encodings else None), hog_missed
+
+# (settings, audit, source image cache) of this encoder process, set by _init_encoder
+_encoder = None
+
+def _init_encoder(settings, audit, worker=True):
+    """Pool initializer: keep the encoder settings (dlib models load once, with face_recognition)."""
+    global _encoder
+    if worker:
+        cv2.setNumThreads(1)
+    _encoder = (settings, audit, {})
+
+def _encode_batch(batch):
+    """Encode a batch of (index, face, data); returns ([(index, encoding, hog_missed, error)], timings)."""
+    settings, audit, sources = _encoder
+    timings = {}
+    results = []
+    for index, face, data in batch:
+        try:
+            encoding, hog_missed = _encode_face(face, data, settings, audit, sources, timings)
+            results.append((index, encoding, hog_missed, None))
+        except Exception as e:
+            message = str(e).strip().splitlines()[-1] if str(e).strip() else ''
+            name = face['name'] if isinstance(face, dict) else os.path.basename(face)
+            results.append((index, None, False, f"{type(e).__name__}: {name}: {message}"))
+    return results, timings
+
+def encode_faces(faces, read_bytes, face_locations='detect', model='small', num_jitters=1, audit=False,
+                 workers=1, batch_size=BATCH_SIZE, cache_dir=None):
+    """
+    Encode face crops in batches, on worker processes with workers > 1.
+
+    The calling process reads each crop's bytes (and looks them up in the
+    embedding cache); misses go to the workers batch_size crops at a time,
+    at most two batches per worker in flight, so memory stays bounded.
+    Each worker loads the dlib models once and decodes, locates and encodes
+    its batches. Failures are counted by exception type, not skipped
+    silently, and are not cached.
+
+    Args:
+        faces (list): Face store records or crop file paths
+        read_bytes: Function returning the encoded bytes of a face
+        face_locations (str): See FACE_LOCATIONS
+        model (str): Landmark model, see MODELS
+        num_jitters (int): Re-samplings averaged per encoding (slower, slightly more accurate)
+        audit (bool): With 'crop' / 'source', count the crops HOG would miss
+        workers (int): Number of encoder processes
+        batch_size (int): Crops per worker batch
+        cache_dir (str): Embedding cache directory (see embedding_cache)
+
+    Returns:
+        tuple: (float32 encoding or None for every face, report dict with the
+        counts, failures and per-stage seconds; see print_encoding_report)
+    """
+    settings = encoder_settings(face_locations, model, num_jitters)
+    cache = EmbeddingCache(cache_dir, settings) if cache_dir is not None else None
+    report = {'faces': len(faces), 'cached': 0, 'hog_missed': 0, 'audit': audit, 'face_locations': face_locations,
+              'failures': Counter(), 'first_errors': {}, 'timings': {}}
+    encodings = [None] * len(faces)
+    hashes = {}
+
+    def fail(error):
+        kind = error.split(':', 1)[0]
+        report['failures'][kind] += 1
+        report['first_errors'].setdefault(kind, error)
+
+    def batches():
+        batch = []
+        for index, face in enumerate(faces):
+            try:
+                with stage_timer(report['timings'], 'read'):
+                    data = bytes(read_bytes(face))
+            except OSError as e:
+                fail(f"{type(e).__name__}: {e}")
+                continue
+            if cache is not None:
+                with stage_timer(report['timings'], 'cache'):
+                    hashes[index] = content_hash(data)
+                    hit = hashes[index] in cache
+                    if hit:
+                        encodings[index] = cache.get(hashes[index])
+                if hit:
+                    report['cached'] += 1
+                    report['hog_missed'] += encodings[index] is None and face_locations == 'detect'
+                    continue
+            batch.append((index, face, data))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def collect(output):
+        results, timings = output
+        for stage, seconds in timings.items():
+            report['timings'][stage] = report['timings'].get(stage, 0.0) + seconds
+        new = []
+        for index, encoding, hog_missed, error in results:
+            if error is not None:
+                fail(error)
+                continue
+            encodings[index] = encoding
+            report['hog_missed'] += hog_missed
+            new.append((hashes.get(index), encoding))
+        if cache is not None and new:
+            # One append to the cache files per batch
+            with stage_timer(report['timings'], 'cache'):
+                cache.put_many(new)
+
+    if workers <= 1:
+        _init_encoder(settings, audit, worker=False)
+        for batch in batches():
+            collect(_encode_batch(batch))
+    else:
+        with multiprocessing.Pool(workers, initializer=_init_encoder, initargs=(settings, audit)) as pool:
+            in_flight = deque()
+            for batch in batches():
+                in_flight.append(pool.apply_async(_encode_batch, (batch,)))
+                if len(in_flight) >= workers * 2:
+                    collect(in_flight.popleft().get())
+            while in_flight:
+                collect(in_flight.popleft().get())
+    return encodings, report
+
+def print_encoding_report(encodings, report, elapsed):
+    """Print the outcome of encode_faces: counts, HOG drops, failures and stage times."""
+    encoded = sum(encoding is not None for encoding in encodings)
+    print(f"Encoded {encoded} of {report['faces']} faces in {elapsed:.1f}s "
+          f"({report['cached']} from the embedding cache)")
+    if report['face_locations'] == 'detect':
+        print(f"HOG re-detection dropped {report['hog_missed']} crops")
+    elif report['audit']:
+        print(f"HOG re-detection would have dropped {report['hog_missed']} crops")
+    for kind, count in report['failures'].most_common():
+        print(f"Failed to encode {count} crops with {kind} (first: {report['first_errors'][kind]})")
+    # Worker stages are summed over all workers
+    print("Stage times: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in report['timings'].items()))
@@ -3,51 +3,202 @@ import cv2
 import os
 from pathlib import Path
 
-def extract_faces_from_directory(directory_path, output_dir):
+from detection_cache import CACHE_NAME, config_key, default_cache_path, open_cache
+from face_pipeline import Stage, collect_face_files, crop_record, decode_stage, run_extraction
+from face_store import add_crop
+from video_frames import VIDEO_EXTENSIONS
+
+# Supported image extensions
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff'}
+
+# Cascade and detectMultiScale parameters (also the detection cache config)
+DETECTION_CONFIG = {'detector': 'basic', 'cascade': 'haarcascade_frontalface_default.xml',
+                    'scaleFactor': 1.3, 'minNeighbors': 5, 'minSize': (30, 30)}
+
+def load_face_cascade():
+    """Load the pre-trained frontal face Haar cascade."""
+    return cv2.CascadeClassifier(cv2.data.haarcascades + DETECTION_CONFIG['cascade'])
+
+def detect_faces(image, face_cascade):
+    """Return (x, y, w, h) face boxes found in a BGR image."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return face_cascade.detectMultiScale(gray, scaleFactor=DETECTION_CONFIG['scaleFactor'],
+                                         minNeighbors=DETECTION_CONFIG['minNeighbors'],
+                                         minSize=DETECTION_CONFIG['minSize'])
+
+def save_faces(image, faces, stem, output_dir, verbose=True, indices=None, store=None):
+    """Save each face box of image as {stem}_face_{i}.jpg; returns the saved paths.
+
+    With indices, only those faces are written (all paths are still returned).
+    With store (a dict of record fields such as source), crops are appended
+    to the face store in output_dir instead of written as files.
+    """
+    face_files = []
+    for i, (x, y, w, h) in enumerate(faces):
+        # Save the face with unique filename
+        output_filename = f"{stem}_face_{i}.jpg"
+        output_path = os.path.join(output_dir, output_filename)
+        face_files.append(output_path)
+        if indices is not None and i not in indices:
+            continue
+        # Extract the face region
+        face_roi = image[y:y+h, x:x+w]
+        if store is not None:
+            add_crop(output_dir, output_filename, face_roi, box=[int(x), int(y), int(w), int(h)],
+                     detector=DETECTION_CONFIG['detector'], **store)
+        else:
+            cv2.imwrite(output_path, face_roi)
+        if verbose:
+            print(f"Saved face {i} to {output_filename}")
+    return face_files
+
+def list_media_files(directory_path):
+    """Return the image and video files of a directory, sorted by name."""
+    return [os.path.join(directory_path, name) for name in sorted(os.listdir(directory_path))
+            if Path(name).suffix.lower() in IMAGE_EXTENSIONS | VIDEO_EXTENSIONS]
+
+def extraction_stages(output_dir, every_n=None, fps=None, keyframes_only=False, cache_path=None, recrop=False,
+                      store=False, decode_threads=2, detect_threads=1, write_threads=2):
+    """
+    Return the decode -> detect -> write pipeline stages of this extractor.
+
+    Detection uses one cascade per thread. With cache_path, fresh detections
+    are stored in the DetectionCache (see face_pipeline.decode_stage). With
+    store, crops go to a face store in output_dir (see face_store).
+    """
+    key = config_key(DETECTION_CONFIG)
+
+    def detect(job, state):
+        if 'faces' not in job:
+            if 'cascade' not in state:
+                state['cascade'] = load_face_cascade()
+            boxes = [tuple(int(v) for v in face) for face in detect_faces(job['image'], state['cascade'])]
+            job['faces'] = [{'box': box} for box in boxes]
+            if 'cache' in job:
+                # The basic detector has no filter stage, so every raw box is accepted
+                open_cache(cache_path).put(job['cache'], key, {
+                    'width': job['image'].shape[1], 'height': job['image'].shape[0],
+                    'raw': [list(box) for box in boxes],
+                    'candidates': [{'box': list(box), 'accepted': True} for box in boxes]})
+            if 'timestamp' not in job:
+                job['log'].append(f"Found {len(job['faces'])} faces in {job['name']}")
+            elif job['faces']:
+                job['log'].append(f"Found {len(job['faces'])} faces in {job['name']} at {job['timestamp']:.2f}s")
+        return job
+
+    def write(job, state):
+        indices = job.get('indices')
+        job['paths'] = save_faces(job.pop('image'), [face['box'] for face in job['faces']], job['stem'],
+                                  output_dir, verbose=False, indices=indices,
+                                  store=crop_record(job) if store else None)
+        job['log'].extend(f"Saved face {i} to {os.path.basename(path)}" for i, path in enumerate(job['paths'])
+                          if indices is None or i in indices)
+        return job
+
+    return [decode_stage(output_dir, key, cache_path, recrop, every_n, fps, keyframes_only, store, decode_threads),
+            Stage('detect', detect, detect_threads),
+            Stage('write', write, write_threads)]
+
+def extract_faces_from_directory(directory_path, output_dir, verbose=True, every_n=None, fps=None,
+                                 keyframes_only=False, workers=1, cache_path=None, recrop=False, store=False,
+                                 **pipeline):
     """
     Extracts faces from all images in the given directory using OpenCV's Haar Cascade.
     Saves each detected face as a separate image in the output directory.
+
+    Files run through a streaming pipeline with overlapped decode, detect
+    and write (pipeline: decode_threads, detect_threads, write_threads,
+    queue_size; see face_pipeline.run_extraction), or through a process
+    pool with workers > 1. Videos are sampled with every_n / fps /
+    keyframes_only; their crops are named {stem}_t{milliseconds}_face_{i}.jpg.
+    With cache_path, image detections are cached. With store, crops are
+    appended to a packed face store in output_dir (see face_store) instead
+    of written as loose files. Returns the saved face paths in file order.
     """
-    # Load the pre-trained face detection cascade
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    
     # Ensure output directory exists
     Path(output_dir).mkdir(parents=True, exist_ok=True)
-    
-    # Supported image extensions
-    image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff'}
-    
-    # Process each image file in the directory
-    for image_file in os.listdir(directory_path):
-        if Path(image_file).suffix.lower() in image_extensions:
-            image_path = os.path.join(directory_path, image_file)
-            image = cv2.imread(image_path)
-            if image is None:
-                print(f"Could not load image: {image_file}")
-                continue
-            
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5, minSize=(30, 30))
-            
-            print(f"Found {len(faces)} faces in {image_file}")
-            
-            for i, (x, y, w, h) in enumerate(faces):
-                # Extract the face region
-                face_roi = image[y:y+h, x:x+w]
-                # Save the face with unique filename
-                output_filename = f"{Path(image_file).stem}_face_{i}.jpg"
-                output_path = os.path.join(output_dir, output_filename)
-                cv2.imwrite(output_path, face_roi)
-                print(f"Saved face {i} to {output_filename}")
+
+    items = run_extraction(list_media_files(directory_path), extraction_stages, workers,
+                           output_dir=output_dir, every_n=every_n, fps=fps, keyframes_only=keyframes_only,
+                           cache_path=cache_path, recrop=recrop, store=store, **pipeline)
+    return collect_face_files(items, verbose)
+
+def add_workers_argument(parser):
+    """Add the --workers option shared by the face extraction CLIs."""
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Number of parallel worker processes (0 = all CPUs, default: 1)")
+
+def add_cache_arguments(parser):
+    """Add the --cache / --recrop options shared by the face extraction CLIs."""
+    group = parser.add_argument_group("detection cache")
+    group.add_argument("--cache", nargs="?", const="", default=None, metavar="FILE",
+                       help=f"Cache image detections by content + detector settings "
+                            f"(default file: DIRECTORY/{CACHE_NAME})")
+    group.add_argument("--recrop", action="store_true",
+                       help="With --cache, rewrite every crop of cached images, not just missing ones")
+
+def cache_options(args):
+    """Return the cache_path / recrop keyword arguments for parsed args."""
+    cache_path = None
+    if args.cache is not None:
+        cache_path = args.cache or default_cache_path(args.directory)
+    return {'cache_path': cache_path, 'recrop': args.recrop}
+
+def add_store_argument(parser):
+    """Add the --store output option shared by the face extraction CLIs."""
+    parser.add_argument("--store", action="store_true",
+                        help="Append crops to a packed face store in the output directory instead of "
+                             "writing loose JPEG files (export with face_store.py)")
+
+def add_pipeline_arguments(parser):
+    """Add the pipeline thread / queue options shared by the face extraction CLIs."""
+    group = parser.add_argument_group("pipeline")
+    group.add_argument("--decode-threads", type=int, default=2, help="Threads reading images (default: 2)")
+    group.add_argument("--detect-threads", type=int, default=1, help="Threads running detection (default: 1)")
+    group.add_argument("--write-threads", type=int, default=2, help="Threads writing crops (default: 2)")
+    group.add_argument("--queue-size", type=int, default=8,
+                       help="Images buffered between pipeline stages (default: 8)")
+
+def pipeline_options(args):
+    """Return the pipeline keyword arguments for parsed args."""
+    return {'decode_threads': args.decode_threads, 'detect_threads': args.detect_threads,
+            'write_threads': args.write_threads, 'queue_size': args.queue_size}
+
+def workers_option(args):
+    """Return the worker count for parsed args (0 = all CPUs)."""
+    return args.workers or os.cpu_count() or 1
+
+def add_sampling_arguments(parser):
+    """Add the video frame sampling options shared by the face extraction CLIs."""
+    group = parser.add_argument_group("video sampling")
+    sampling = group.add_mutually_exclusive_group()
+    sampling.add_argument("--fps", type=float, default=None,
+                          help="Sample videos at this many frames per second (default: 1)")
+    sampling.add_argument("--every-n", type=int, default=None, help="Sample every Nth video frame")
+    sampling.add_argument("--keyframes", action="store_true", help="Sample only video keyframes")
+
+def sampling_options(args):
+    """Return the every_n / fps / keyframes_only keyword arguments for parsed args."""
+    fps = args.fps
+    if fps is None and not args.every_n and not args.keyframes:
+        fps = 1.0
+    return {'every_n': args.every_n, 'fps': fps, 'keyframes_only': args.keyframes}
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Extract faces from images in a directory.")
+    parser = argparse.ArgumentParser(description="Extract faces from images and videos in a directory.")
     parser.add_argument("directory", help="Path to the directory containing images.")
     parser.add_argument("--output", "-o", default="extracted_faces", help="Output directory for faces (default: extracted_faces)")
-    
+    add_sampling_arguments(parser)
+    add_workers_argument(parser)
+    add_cache_arguments(parser)
+    add_pipeline_arguments(parser)
+    add_store_argument(parser)
+
     args = parser.parse_args()
-    
+
     if not os.path.isdir(args.directory):
         print(f"Error: {args.directory} is not a valid directory.")
     else:
-        extract_faces_from_directory(args.directory, args.output)
+        extract_faces_from_directory(args.directory, args.output, **sampling_options(args),
+                                     workers=workers_option(args), **cache_options(args),
+                                     **pipeline_options(args), store=args.store)
@@ -0,0 +1,269 @@
+import multiprocessing
+import os
+import threading
+from pathlib import Path
+from queue import Empty, Full, Queue
+
+import cv2
+
+from detection_cache import open_cache
+from face_store import FaceStore, is_face_store
+from video_frames import VIDEO_EXTENSIONS, iter_video_frames
+
+# End-of-stream marker passed between stages
+_END = object()
+
+class Stage:
+    """
+    One step of an extraction pipeline.
+
+    function(item, state) takes an item dict and returns an item, None (drop
+    it) or an iterable of items (e.g. one per video frame). state is a dict
+    private to the calling thread, for things like cascades that must not
+    be shared between threads. Items with 'done' set skip the remaining
+    stages.
+    """
+
+    def __init__(self, name, function, threads=1):
+        self.name = name
+        self.function = function
+        self.threads = max(1, threads)
+        # State used by run_inline (kept across calls, e.g. per worker process)
+        self.state = {}
+
+def _outputs(stage, item, state):
+    """Yield the items stage produces for item, turning an exception into a finished error item."""
+    try:
+        result = stage.function(item, state)
+        if result is None:
+            return
+        if isinstance(result, dict):
+            yield result
+            return
+        for output in result:
+            yield output
+    except Exception as e:
+        yield {'key': item.get('key', ()), 'done': True,
+               'log': item.get('log', []) + [f"Error in {stage.name} for {item.get('name', '?')}: {e}"]}
+
+def run_inline(source, stages):
+    """Run items through the stages one after another in the calling thread."""
+    items = iter(source)
+    for stage in stages:
+        items = _run_stage_inline(stage, items)
+    return items
+
+def _run_stage_inline(stage, items):
+    for item in items:
+        if item.get('done'):
+            yield item
+        else:
+            yield from _outputs(stage, item, stage.state)
+
+def run_pipeline(source, stages, queue_size=8):
+    """
+    Run items through the stages concurrently and yield the finished items.
+
+    The source is consumed by its own thread and every stage runs on
+    stage.threads threads; stages are joined by queues holding at most
+    queue_size items, so a slow stage blocks the ones before it and memory
+    stays bounded however many items the source yields. imread, imwrite and
+    detectMultiScale release the GIL, so disk I/O overlaps with detection.
+
+    Items come out in completion order (sort by 'key' for a stable order).
+    Closing the generator early stops all threads.
+    """
+    stop = threading.Event()
+    queues = [Queue(maxsize=max(1, queue_size)) for _ in range(len(stages) + 1)]
+    failures = []
+
+    def put(queue, item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def get(queue):
+        while not stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                continue
+        return _END
+
+    def feed():
+        try:
+            for item in source:
+                if not put(queues[0], item):
+                    return
+        except Exception as e:
+            failures.append(e)
+        put(queues[0], _END)
+
+    def work(index, stage, remaining, lock):
+        state = {}
+        inbox, outbox = queues[index], queues[index + 1]
+        while True:
+            item = get(inbox)
+            if item is _END:
+                # Let the other threads of this stage see the end too
+                put(inbox, _END)
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    put(outbox, _END)
+                return
+            outputs = [item] if item.get('done') else _outputs(stage, item, state)
+            for output in outputs:
+                if not put(outbox, output):
+                    return
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for index, stage in enumerate(stages):
+        remaining, lock = [stage.threads], threading.Lock()
+        threads.extend(threading.Thread(target=work, args=(index, stage, remaining, lock), daemon=True)
+                       for _ in range(stage.threads))
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = get(queues[-1])
+            if item is _END:
+                break
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    if failures:
+        raise failures[0]
+
+# Stages of the run_extraction worker processes, built once per worker
+_worker_stages = None
+
+def _init_worker(make_stages, options, threads):
+    """Pool initializer: cap OpenCV threads and build the stages once per worker."""
+    global _worker_stages
+    cv2.setNumThreads(threads)
+    _worker_stages = make_stages(**options)
+
+def _run_worker_file(job):
+    """Run one file through the worker's stages."""
+    return list(run_inline([job], _worker_stages))
+
+def run_extraction(file_paths, make_stages, workers=1, queue_size=8, **options):
+    """
+    Run make_stages(**options) over file_paths and yield the finished items.
+
+    With workers <= 1 the stages run as one threaded run_pipeline (scan,
+    decode, detect, ... and write overlap). With workers > 1 files are sent
+    in chunks to a process pool whose initializer builds the stages (and so
+    loads the cascades) once per worker and sets cv2.setNumThreads so that
+    workers x OpenCV threads stays within the CPU count; each worker runs
+    the stages inline and results come back in file order.
+
+    Args:
+        file_paths (list): Files to process
+        make_stages: Module-level function (picklable) returning the stages
+        workers (int): Number of worker processes (1 = threaded pipeline)
+        queue_size (int): Items buffered between pipeline stages
+    """
+    jobs = [{'key': (index,), 'path': file_path} for index, file_path in enumerate(file_paths)]
+    if workers <= 1 or len(jobs) <= 1:
+        yield from run_pipeline(jobs, make_stages(**options), queue_size)
+        return
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(make_stages, options, threads)) as pool:
+        for items in pool.imap(_run_worker_file, jobs, chunksize):
+            yield from items
+
+def collect_face_files(items, verbose=True):
+    """Print the items' log lines as they finish and return their face paths in file order."""
+    results = []
+    for item in items:
+        if verbose:
+            for line in item.get('log', []):
+                print(line)
+        results.append((item['key'], item.get('paths', [])))
+    results.sort(key=lambda result: result[0])
+    return [path for _, paths in results for path in paths]
+
+def crop_record(job):
+    """Return the face store record fields of a decoded job (source image, frame timestamp)."""
+    record = {'source': job['source']}
+    if 'timestamp' in job:
+        record['timestamp'] = job['timestamp']
+    return record
+
+def decode_stage(output_dir, key=None, cache_path=None, recrop=False, every_n=None, fps=None,
+                 keyframes_only=False, store=False, threads=2):
+    """
+    Return the shared decode Stage: file item -> image / frame items.
+
+    Images are read with cv2.imread. Videos become one item per sampled
+    frame (copied out of iter_video_frames' reused buffers), preceded by a
+    finished 'Processing video' log item.
+
+    With cache_path, image detections are looked up under config key first.
+    A hit whose crops all exist finishes here without decoding. A hit with
+    missing crops (or recrop) carries its cached faces and the crop indices
+    to rewrite, so detection is skipped. A miss carries the content hash
+    ('cache') for the detection stage to store its result under. With store,
+    crops count as present when the face store in output_dir has their name.
+    """
+    if store:
+        stored = FaceStore(output_dir).names() if is_face_store(output_dir) else set()
+        crop_exists = lambda path: os.path.basename(path) in stored
+    else:
+        crop_exists = os.path.exists
+
+    def decode(item, state):
+        file_path = item['path']
+        name = os.path.basename(file_path)
+        stem = Path(name).stem
+
+        if Path(name).suffix.lower() in VIDEO_EXTENSIONS:
+            yield {'key': item['key'] + (-1,), 'done': True, 'log': [f"Processing video: {name}"]}
+            try:
+                for index, (timestamp, frame) in enumerate(iter_video_frames(file_path, every_n, fps,
+                                                                             keyframes_only)):
+                    yield {'key': item['key'] + (index,), 'name': name, 'source': file_path, 'timestamp': timestamp,
+                           'stem': f"{stem}_t{int(round((timestamp or 0) * 1000)):09d}",
+                           'image': frame.copy(), 'log': []}
+            except (OSError, RuntimeError, ValueError) as e:
+                yield {'key': item['key'] + (float('inf'),), 'done': True,
+                       'log': [f"Could not read video {name}: {e}"]}
+            return
+
+        job = {'key': item['key'], 'name': name, 'source': file_path, 'stem': stem, 'log': []}
+        if cache_path:
+            cache = open_cache(cache_path)
+            job['cache'] = cache.file_hash(file_path)
+            entry = cache.get(job['cache'], key)
+            if entry is not None:
+                faces = [dict(face, box=tuple(face['box'])) for face in entry['candidates'] if face['accepted']]
+                paths = [os.path.join(output_dir, f"{stem}_face_{i}.jpg") for i in range(len(faces))]
+                missing = {i for i, path in enumerate(paths) if recrop or not crop_exists(path)}
+                if not missing:
+                    job.update(done=True, paths=paths,
+                               log=[f"Cached: {name} ({len(faces)} faces, crops present)"])
+                    yield job
+                    return
+                del job['cache']
+                job.update(faces=faces, indices=missing,
+                           log=[f"Cached: {name} (re-cropping {len(missing)} of {len(faces)} faces)"])
+
+        job['image'] = cv2.imread(file_path)
+        if job['image'] is None:
+            job.update(done=True, log=job['log'] + [f"Could not load image: {name}"])
+        yield job
+
+    return Stage('decode', decode, threads)
@@ -0,0 +1,182 @@
+import argparse
+import glob
+import json
+import os
+import struct
+import threading
+import uuid
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+INDEX_PATTERN = 'index-*.jsonl'
+SHARD_BYTES = 256 * 1024 * 1024
+
+# Length prefix written before every blob (little-endian uint32)
+_LENGTH = struct.Struct('<I')
+
+# Open writers of this process, by store directory
+_open_writers = {}
+_open_writers_lock = threading.Lock()
+
+def is_face_store(path):
+    """Return True if path is a face store directory."""
+    return os.path.isdir(path) and bool(glob.glob(os.path.join(path, INDEX_PATTERN)))
+
+class FaceStoreWriter:
+    """
+    Appends encoded face crops to sharded container files.
+
+    Each writer owns its files: shard-{tag}-{n}.bin holds length-prefixed
+    JPEG blobs and index-{tag}.jsonl one JSON record per crop (name, shard,
+    offset, length, source image, box, detector, ...). Separate writers
+    (processes, runs) never touch each other's files, so a store can be
+    appended to concurrently; readers merge every index file. Shards roll
+    over at shard_bytes. add() is thread-safe.
+    """
+
+    def __init__(self, store_dir, shard_bytes=SHARD_BYTES):
+        Path(store_dir).mkdir(parents=True, exist_ok=True)
+        self.store_dir = store_dir
+        self.shard_bytes = shard_bytes
+        self.tag = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.lock = threading.Lock()
+        self.shard_number = -1
+        self.shard = None
+        self.index = open(os.path.join(store_dir, f"index-{self.tag}.jsonl"), 'a')
+        self._next_shard()
+
+    def _next_shard(self):
+        if self.shard:
+            self.shard.close()
+        self.shard_number += 1
+        self.shard_name = f"shard-{self.tag}-{self.shard_number:04d}.bin"
+        self.shard = open(os.path.join(self.store_dir, self.shard_name), 'ab')
+
+    def add(self, name, data, **meta):
+        """
+        Append one encoded crop and its index record.
+
+        Args:
+            name (str): Crop name (the file name it gets on export)
+            data (bytes | ndarray): Encoded image bytes
+            **meta: JSON-serializable fields stored in the record (source, box, detector, ...)
+
+        Returns:
+            dict: The index record
+        """
+        data = memoryview(np.ascontiguousarray(data)).cast('B') if isinstance(data, np.ndarray) else data
+        with self.lock:
+            if self.shard.tell() and self.shard.tell() + len(data) + _LENGTH.size > self.shard_bytes:
+                self._next_shard()
+            self.shard.write(_LENGTH.pack(len(data)))
+            offset = self.shard.tell()
+            self.shard.write(data)
+            self.shard.flush()
+            record = dict(meta, name=name, shard=self.shard_name, offset=offset, length=len(data))
+            # The blob is flushed before its record, so every indexed crop is complete
+            self.index.write(json.dumps(record, separators=(',', ':')) + '\n')
+            self.index.flush()
+        return record
+
+    def close(self):
+        with self.lock:
+            self.shard.close()
+            self.index.close()
+
+def open_writer(store_dir):
+    """Return this process's FaceStoreWriter for store_dir, opening it on first use."""
+    key = (os.getpid(), os.path.abspath(store_dir))
+    with _open_writers_lock:
+        if key not in _open_writers:
+            _open_writers[key] = FaceStoreWriter(store_dir)
+        return _open_writers[key]
+
+def add_crop(store_dir, name, crop, **meta):
+    """JPEG-encode a BGR crop exactly as cv2.imwrite would and append it to the store."""
+    ok, encoded = cv2.imencode('.jpg', crop)
+    if not ok:
+        raise ValueError(f"Could not encode {name}")
+    return open_writer(store_dir).add(name, encoded, **meta)
+
+class FaceStore:
+    """
+    Read-only view of a face store.
+
+    Records come from all index files, oldest file first; when a crop name
+    was stored again (a re-run or --recrop), the latest record wins. Shards are memory-mapped on first use, and data() returns a slice of
+    the map, so reading a crop copies nothing until it is decoded.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        records = {}
+        for index_path in sorted(glob.glob(os.path.join(store_dir, INDEX_PATTERN)), key=os.path.getmtime):
+            with open(index_path) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        records.pop(record['name'], None)
+                        records[record['name']] = record
+        self.records = list(records.values())
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def names(self):
+        """Return the set of crop names in the store."""
+        return {record['name'] for record in self.records}
+
+    def data(self, record):
+        """Return the encoded bytes of a record as a zero-copy uint8 view of its shard."""
+        shard = self._shards.get(record['shard'])
+        if shard is None:
+            shard = np.memmap(os.path.join(self.store_dir, record['shard']), dtype=np.uint8, mode='r')
+            self._shards[record['shard']] = shard
+        return shard[record['offset']:record['offset'] + record['length']]
+
+    def image(self, record, rgb=False):
+        """Decode a record's crop (BGR, or RGB with rgb=True)."""
+        image = cv2.imdecode(self.data(record), cv2.IMREAD_COLOR)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB) if rgb and image is not None else image
+
+    def export(self, output_dir, records=None):
+        """Write records (default: all) as loose {name} files; returns the written paths."""
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        paths = []
+        for record in self.records if records is None else records:
+            path = os.path.join(output_dir, record['name'])
+            self.data(record).tofile(path)
+            paths.append(path)
+        return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or export a packed face crop store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="Show the number of crops, shards and bytes in a store")
+    info.add_argument("store", help="Face store directory")
+    export = commands.add_parser("export", help="Write every crop as a loose JPEG file")
+    export.add_argument("store", help="Face store directory")
+    export.add_argument("output", help="Output directory for the loose files")
+
+    args = parser.parse_args()
+
+    if not is_face_store(args.store):
+        print(f"Error: {args.store} is not a face store.")
+        exit(1)
+
+    store = FaceStore(args.store)
+    if args.command == "info":
+        shards = {record['shard'] for record in store}
+        sources = {record.get('source') for record in store}
+        total = sum(record['length'] for record in store)
+        print(f"{len(store)} crops from {len(sources)} sources in {len(shards)} shards, "
+              f"{total / 1024 / 1024:.1f} MB")
+    else:
+        paths = store.export(args.output)
+        print(f"✅ Exported {len(paths)} crops to '{args.output}'")
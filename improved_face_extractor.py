@@ -1,22 +1,51 @@
 import argparse
+import contextlib
 import cv2
 import os
+import time
 import numpy as np
 from pathlib import Path
 from PIL import Image, ImageFilter
 
+from face_extractor import (IMAGE_EXTENSIONS, add_cache_arguments, add_pipeline_arguments, add_sampling_arguments,
+                            add_store_argument, add_workers_argument, cache_options, list_media_files,
+                            pipeline_options, sampling_options, workers_option)
+from face_pipeline import Stage, collect_face_files, crop_record, decode_stage, run_extraction
+from face_store import add_crop
+from detection_cache import config_key, open_cache
+
+@contextlib.contextmanager
+def stage_timer(timings, name):
+    """Add the wall time of the block to timings[name] (no-op when timings is None)"""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+# preprocess_image parameters (part of the detection cache key)
+PREPROCESS_SETTINGS = {'clahe_clip': 3.0, 'clahe_grid': (8, 8), 'bilateral': (9, 75, 75)}
+
+# is_likely_face / filter_likely_faces thresholds (part of the detection cache key)
+FILTER_SETTINGS = {'aspect_ratio': (0.7, 1.5), 'min_std': 20, 'skin_hsv': ((0, 20, 70), (20, 255, 255)),
+                   'min_skin_ratio': 0.7}
+
 def preprocess_image(image):
     """Preprocess image for better face detection"""
     # Convert to LAB color space and enhance contrast
     lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
     l, a, b = cv2.split(lab)
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+    clahe = cv2.createCLAHE(clipLimit=PREPROCESS_SETTINGS['clahe_clip'],
+                            tileGridSize=PREPROCESS_SETTINGS['clahe_grid'])
     l = clahe.apply(l)
     enhanced = cv2.merge([l, a, b])
     enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
     
     # Denoise
-    enhanced = cv2.bilateralFilter(enhanced, 9, 75, 75)
+    enhanced = cv2.bilateralFilter(enhanced, *PREPROCESS_SETTINGS['bilateral'])
     return enhanced
 
 def is_likely_face(image_roi, min_area_ratio=0.7):
@@ -43,101 +72,519 @@ def is_likely_face(image_roi, min_area_ratio=0.7):
     
     return skin_ratio > min_area_ratio
 
-def extract_faces_improved(directory_path, output_dir):
-    """Advanced face extraction with profile detection and false positive filtering"""
-    
-    # Load ALL available face cascades
-    cascades = {
-        'frontal': cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'),
-        'profile': cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_profileface.xml'),
-        'frontal_alt': cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_alt.xml'),
-        'frontal_alt2': cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml')
-    }
-    
-    Path(output_dir).mkdir(parents=True, exist_ok=True)
-    image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff'}
+def filter_likely_faces(image, boxes, min_area_ratio=FILTER_SETTINGS['min_skin_ratio']):
+    """
+    Batch version of is_likely_face for many (x, y, w, h) boxes of one image.
+
+    The grayscale image and HSV skin mask are computed once, over the
+    rectangle covering all boxes, together with integral images of the mask,
+    gray and gray squared. Every box's skin ratio and standard deviation then
+    comes from four lookups per table, vectorized over all boxes. Sums are
+    kept exact, so the result matches is_likely_face box for box.
+
+    Returns:
+        ndarray: One bool per box
+    """
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    keep = np.zeros(len(boxes), dtype=bool)
+    valid = (boxes[:, 2] > 0) & (boxes[:, 3] > 0)
+    if not valid.any():
+        return keep
+
+    # Only convert the part of the image the boxes cover
+    x0, y0 = boxes[valid, :2].min(axis=0)
+    x1, y1 = (boxes[valid, :2] + boxes[valid, 2:]).max(axis=0)
+    region = image[y0:y1, x0:x1]
+    gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
+    hsv = cv2.cvtColor(region, cv2.COLOR_BGR2HSV)
+    skin_low, skin_high = FILTER_SETTINGS['skin_hsv']
+    skin_mask = cv2.inRange(hsv, np.array(skin_low), np.array(skin_high))
+    # Float64 sums are exact here (< 2**53) and cannot overflow like int32
+    gray_sum, gray_sqsum = cv2.integral2(gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+    skin_sum = cv2.integral(skin_mask // 255, sdepth=cv2.CV_64F)
+
+    x, y, w, h = (boxes[valid] - [x0, y0, 0, 0]).T
+
+    def box_sums(table):
+        return (table[y + h, x + w] - table[y, x + w] - table[y + h, x] + table[y, x]).astype(np.int64)
+
+    total_pixels = w * h
+    gray_total, gray_squares, skin_pixels = box_sums(gray_sum), box_sums(gray_sqsum), box_sums(skin_sum)
+
+    # Check aspect ratio (faces are roughly square)
+    aspect_ratio = w / h
+    min_aspect, max_aspect = FILTER_SETTINGS['aspect_ratio']
+    square = (min_aspect < aspect_ratio) & (aspect_ratio < max_aspect)
+
+    # Check for sufficient contrast: std >= 20  <=>  n * sum(g^2) - sum(g)^2 >= 400 * n^2,
+    # exact in int64 for boxes up to ~9M pixels; larger boxes fall back to float
+    min_variance = FILTER_SETTINGS['min_std'] ** 2
+    exact = total_pixels <= 9_000_000
+    with np.errstate(over='ignore'):
+        contrast_exact = (total_pixels * gray_squares - gray_total * gray_total
+                          >= min_variance * total_pixels * total_pixels)
+    mean = gray_total / total_pixels
+    contrast_float = gray_squares / total_pixels - mean * mean >= min_variance
+    contrast = np.where(exact, contrast_exact, contrast_float)
+
+    # Check for skin-like color distribution
+    skin_ratio = skin_pixels / total_pixels
+
+    keep[valid] = square & contrast & (skin_ratio > min_area_ratio)
+    return keep
+
+# Haar cascades available to the detector, by name
+CASCADE_FILES = {
+    'frontal': 'haarcascade_frontalface_default.xml',
+    'profile': 'haarcascade_profileface.xml',
+    'frontal_alt': 'haarcascade_frontalface_alt.xml',
+    'frontal_alt2': 'haarcascade_frontalface_alt2.xml',
+}
+
+# detectMultiScale parameter sets run for every cascade. Sizes are in
+# full-resolution pixels and are scaled down with the working image.
+DETECTION_PASSES = {
+    # Standard parameters
+    'standard': {'scaleFactor': 1.1, 'minNeighbors': 4, 'minSize': (40, 40), 'maxSize': (500, 500)},
+    # Relaxed parameters for hard-to-detect faces
+    'relaxed': {'scaleFactor': 1.2, 'minNeighbors': 2, 'minSize': (30, 30), 'maxSize': (500, 500)},
+}
+
+# --fast: one frontal and the profile cascade, standard pass, ~1.3MP proxy
+FAST_PRESET = {'cascade_names': ['frontal_alt2', 'profile'], 'passes': ['standard'], 'work_size': 1280}
+
+def load_cascades(names=None):
+    """Load the named face cascades (default: ALL available cascades)"""
+    names = names or list(CASCADE_FILES)
+    unknown = [name for name in names if name not in CASCADE_FILES]
+    if unknown:
+        raise ValueError(f"Unknown cascade(s): {', '.join(unknown)}")
+    return {name: cv2.CascadeClassifier(cv2.data.haarcascades + CASCADE_FILES[name]) for name in names}
+
+def _scaled_size(size, scale):
+    """Scale a (w, h) detection size to the working image, never below 1 pixel"""
+    return (max(1, int(round(size[0] * scale))), max(1, int(round(size[1] * scale))))
+
+def detect_faces(image, cascades, passes=None, work_size=None, timings=None):
+    """
+    Run every cascade with every parameter pass and return the raw boxes
+    in full-resolution coordinates with their scores and sources.
+
+    With work_size set, images whose longer side exceeds it are detected on
+    a proxy downscaled to work_size: preprocessing and detectMultiScale only
+    see the proxy, the pass min/max sizes are scaled with it, and the boxes
+    are mapped back to the original image.
+
+    Args:
+        image: BGR image
+        cascades (dict): name -> CascadeClassifier (see load_cascades)
+        passes (list): DETECTION_PASSES names to run (default: all)
+        work_size (int): Longest side of the detection proxy (None = full resolution)
+        timings (dict): Accumulates seconds per stage (resize, preprocess,
+            one 'cascade/pass' entry per detectMultiScale run)
+
+    Returns:
+        tuple: (N x 4 int array of (x, y, w, h), N neighbour-count scores,
+            N 'cascade/pass' source names)
+    """
+    height, width = image.shape[:2]
+    scale = 1.0
+    if work_size and max(height, width) > work_size:
+        scale = work_size / max(height, width)
+        with stage_timer(timings, 'resize'):
+            proxy = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+    else:
+        proxy = image
+
+    # Preprocess image
+    with stage_timer(timings, 'preprocess'):
+        enhanced = preprocess_image(proxy)
+        gray = cv2.cvtColor(enhanced, cv2.COLOR_BGR2GRAY)
+
+    boxes, scores, sources = [], [], []
+
+    # Detect with different cascades and parameters
+    for name, cascade in cascades.items():
+        if cascade.empty():
+            continue
+        for pass_name in passes or DETECTION_PASSES:
+            params = dict(DETECTION_PASSES[pass_name])
+            params['minSize'] = _scaled_size(params['minSize'], scale)
+            params['maxSize'] = _scaled_size(params['maxSize'], scale)
+            # numDetections (neighbours merged into each box) doubles as its confidence
+            with stage_timer(timings, f"{name}/{pass_name}"):
+                faces, neighbours = cascade.detectMultiScale2(gray, **params)
+            boxes.extend(faces)
+            scores.extend(neighbours)
+            sources.extend([f"{name}/{pass_name}"] * len(faces))
+
+    boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+    if scale != 1.0:
+        # Map proxy boxes back to full-resolution coordinates
+        corners = np.round(np.hstack([boxes[:, :2], boxes[:, :2] + boxes[:, 2:]]) / scale)
+        corners[:, 2] = np.minimum(corners[:, 2], width)
+        corners[:, 3] = np.minimum(corners[:, 3], height)
+        boxes = np.hstack([corners[:, :2], corners[:, 2:] - corners[:, :2]])
+    return boxes.astype(int), np.array(scores, dtype=np.float64), sources
+
+def non_max_suppression(boxes, scores, iou=0.3, merge=False):
+    """
+    Greedy IoU non-maximum suppression over (x, y, w, h) boxes.
+
+    Boxes are visited best score first; each kept box suppresses every
+    remaining box that overlaps it by more than iou. The overlap test is
+    vectorized over all remaining boxes, so one pass costs O(n) NumPy work
+    instead of a Python loop per pair.
+
+    Args:
+        boxes (ndarray): N x 4 boxes
+        scores (ndarray): N confidences (higher wins)
+        iou (float): Overlap above which a box is a duplicate
+        merge (bool): Replace each kept box with the score-weighted mean of
+            the boxes it suppressed (itself included)
+
+    Returns:
+        list: (kept index, merged box, suppressed indices) per kept box, best first
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+    # Ties (equal neighbour counts) prefer the larger box
+    order = np.lexsort((-areas, -scores))
+
+    kept = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        iw = np.clip(np.minimum(x1[best], x1[rest]) - np.maximum(x0[best], x0[rest]), 0, None)
+        ih = np.clip(np.minimum(y1[best], y1[rest]) - np.maximum(y0[best], y0[rest]), 0, None)
+        inter = iw * ih
+        union = areas[best] + areas[rest] - inter
+        overlap = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+        duplicates = rest[overlap > iou]
+        group = np.concatenate([[best], duplicates])
+        box = boxes[best]
+        if merge and duplicates.size:
+            weights = np.maximum(scores[group], 1e-6)
+            box = np.average(boxes[group], axis=0, weights=weights)
+        kept.append((int(best), tuple(int(round(v)) for v in box), group))
+        order = rest[overlap <= iou]
+    return kept
+
+def candidate_faces(image, cascades, passes=None, work_size=None, iou=0.3, merge=False, timings=None):
+    """
+    Detect faces and remove duplicates (non_max_suppression); no filtering.
+
+    Returns:
+        tuple: (candidates, raw) - one dict per box left after deduplication
+            with box (x, y, w, h, clipped to the image), score, source
+            ('cascade/pass' of the winning box) and votes (number of raw
+            boxes merged into it); raw lists every cascade box as
+            [x, y, w, h, score, source]
+    """
+    boxes, scores, sources = detect_faces(image, cascades, passes, work_size, timings)
+
+    # Remove duplicates (boxes overlapping a better one by more than iou)
+    height, width = image.shape[:2]
+    candidates = []
+    with stage_timer(timings, 'dedup'):
+        for index, (x, y, w, h), group in non_max_suppression(boxes, scores, iou, merge):
+            # Clip to the image so merged / mapped-back boxes never index outside it
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(width, x + w), min(height, y + h)
+            candidates.append({'box': (x0, y0, x1 - x0, y1 - y0), 'score': float(scores[index]),
+                               'source': sources[index], 'votes': len(group)})
+
+    raw = [[int(v) for v in box] + [float(score), source] for box, score, source in zip(boxes, scores, sources)]
+    return candidates, raw
+
+def accept_faces(image, candidates, timings=None):
+    """Filter false positives: set each candidate's 'accepted' flag and return the accepted ones"""
+    with stage_timer(timings, 'filter'):
+        likely = filter_likely_faces(image, [face['box'] for face in candidates])
+    for face, is_face in zip(candidates, likely):
+        face['accepted'] = bool(is_face)
+    return [{key: value for key, value in face.items() if key != 'accepted'}
+            for face in candidates if face['accepted']]
+
+def find_faces(image, cascades, passes=None, work_size=None, iou=0.3, merge=False, verbose=True,
+               timings=None, details=None):
+    """
+    Detect, deduplicate (non_max_suppression) and filter faces.
+
+    timings, if given, accumulates seconds per stage (see detect_faces, plus
+    dedup and filter). details, if given, receives 'raw' (every cascade box
+    as [x, y, w, h, score, source]) and 'candidates' (every box left after
+    deduplication with its filter decision, 'accepted').
+
+    Returns:
+        list: One dict per accepted face with box (x, y, w, h), score,
+            source ('cascade/pass' of the winning box) and votes (number of
+            raw boxes merged into it)
+    """
+    candidates, raw = candidate_faces(image, cascades, passes, work_size, iou, merge, timings)
+    faces = accept_faces(image, candidates, timings)
+    if verbose:
+        for _ in range(len(candidates) - len(faces)):
+            print(f"  Rejected non-face region")
+
+    if details is not None:
+        details['raw'] = raw
+        details['candidates'] = candidates
+    return faces
+
+def save_face_crops(image, faces, stem, output_dir, verbose=True, timings=None, indices=None, store=None):
+    """Save the find_faces results of image as 160x160 {stem}_face_{i}.jpg crops; returns the paths
+
+    With indices, only those faces are written (all paths are still returned).
+    With store (a dict of record fields such as source), crops are appended
+    to the face store in output_dir instead of written as files.
+    """
     face_files = []
-    
-    for image_file in os.listdir(directory_path):
-        if Path(image_file).suffix.lower() in image_extensions:
-            image_path = os.path.join(directory_path, image_file)
-            image = cv2.imread(image_path)
-            if image is None:
-                print(f"Could not load: {image_file}")
-                continue
-            
-            print(f"Processing: {image_file}")
-            
-            # Preprocess image
-            enhanced = preprocess_image(image)
-            gray = cv2.cvtColor(enhanced, cv2.COLOR_BGR2GRAY)
-            
-            all_faces = []
-            
-            # Detect with different cascades and parameters
-            for name, cascade in cascades.items():
-                if cascade.empty():
-                    continue
-                
-                # Standard parameters
-                faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4, 
-                                               minSize=(40, 40), maxSize=(500, 500))
-                
-                # Relaxed parameters for hard-to-detect faces
-                faces_relaxed = cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=2, 
-                                                       minSize=(30, 30), maxSize=(500, 500))
-                
-                # Combine and deduplicate
-                all_faces.extend(faces)
-                all_faces.extend(faces_relaxed)
-            
-            # Remove duplicates (faces closer than 20% overlap)
-            unique_faces = []
-            for (x, y, w, h) in all_faces:
-                is_duplicate = False
-                for existing in unique_faces:
-                    ex, ey, ew, eh = existing
-                    if (abs(x - ex) < 0.2 * w and abs(y - ey) < 0.2 * h):
-                        is_duplicate = True
-                        break
-                if not is_duplicate:
-                    unique_faces.append((x, y, w, h))
-            
-            # Filter false positives and save valid faces
-            valid_count = 0
-            for i, (x, y, w, h) in enumerate(unique_faces):
-                face_roi = image[y:y+h, x:x+w]
-                
-                # Apply false positive filter
-                if is_likely_face(face_roi):
-                    # Additional cleanup
-                    face_roi = cv2.resize(face_roi, (160, 160))
-                    face_roi = cv2.GaussianBlur(face_roi, (5, 5), 0)
-                    
-                    output_filename = f"{Path(image_file).stem}_face_{valid_count}.jpg"
-                    output_path = os.path.join(output_dir, output_filename)
-                    cv2.imwrite(output_path, face_roi)
-                    face_files.append(output_path)
-                    valid_count += 1
-                    print(f"  Saved face {valid_count} ({w}x{h})")
-                else:
-                    print(f"  Rejected non-face region")
-            
-            print(f"Total valid faces from {image_file}: {valid_count}\n")
-    
+
+    for valid_count, face in enumerate(faces):
+        output_path = os.path.join(output_dir, f"{stem}_face_{valid_count}.jpg")
+        face_files.append(output_path)
+        if indices is not None and valid_count not in indices:
+            continue
+        x, y, w, h = face['box']
+
+        # Additional cleanup
+        with stage_timer(timings, 'resize_blur'):
+            face_roi = cv2.resize(image[y:y+h, x:x+w], (160, 160))
+            face_roi = cv2.GaussianBlur(face_roi, (5, 5), 0)
+
+        with stage_timer(timings, 'imwrite'):
+            if store is not None:
+                add_crop(output_dir, os.path.basename(output_path), face_roi, box=[int(v) for v in face['box']],
+                         detector=face['source'], **store)
+            else:
+                cv2.imwrite(output_path, face_roi)
+        if verbose:
+            print(f"  Saved face {valid_count + 1} ({w}x{h}, {face['source']}, {face['votes']} boxes)")
+
     return face_files
 
+def extract_faces_from_image(image, stem, output_dir, cascades, **detection):
+    """Detect, filter and save the faces of one BGR image; returns the saved paths
+
+    detection holds the find_faces options (passes, work_size, iou, merge).
+    """
+    return save_face_crops(image, find_faces(image, cascades, **detection), stem, output_dir)
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union else 0.0
+
+def compare_detection(directory_path, cascade_names=None, match_iou=0.5, **detection):
+    """
+    Report the speed / recall trade-off of a detection configuration against
+    the exhaustive mode (all cascades, all passes, full resolution).
+
+    Recall is the share of faces accepted by the exhaustive mode that the
+    configuration also finds (IoU >= match_iou). Both sides use the same
+    duplicate suppression (detection iou / merge). Only images are
+    compared; nothing is saved.
+
+    Returns:
+        dict: Totals (images, exhaustive/config seconds and faces, matched, speedup, recall)
+    """
+    exhaustive_cascades = load_cascades()
+    suppression = {key: detection[key] for key in ('iou', 'merge') if key in detection}
+    cascades = load_cascades(cascade_names)
+    totals = {'images': 0, 'exhaustive_seconds': 0.0, 'config_seconds': 0.0,
+              'exhaustive_faces': 0, 'config_faces': 0, 'matched': 0}
+
+    print(f"{'Image':<30} {'Exhaustive':>16} {'Config':>16} {'Recall':>8}")
+    for image_file in sorted(os.listdir(directory_path)):
+        if Path(image_file).suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        image = cv2.imread(os.path.join(directory_path, image_file))
+        if image is None:
+            print(f"Could not load: {image_file}")
+            continue
+
+        start = time.perf_counter()
+        reference = find_faces(image, exhaustive_cascades, **suppression, verbose=False)
+        exhaustive_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        found = find_faces(image, cascades, **detection, verbose=False)
+        config_seconds = time.perf_counter() - start
+
+        matched = sum(1 for ref in reference
+                      if any(box_iou(ref['box'], face['box']) >= match_iou for face in found))
+        recall = f"{matched / len(reference):.0%}" if reference else "-"
+        print(f"{image_file[:30]:<30} {exhaustive_seconds:>7.2f}s {len(reference):>3} faces "
+              f"{config_seconds:>7.2f}s {len(found):>3} faces {recall:>8}")
+
+        totals['images'] += 1
+        totals['exhaustive_seconds'] += exhaustive_seconds
+        totals['config_seconds'] += config_seconds
+        totals['exhaustive_faces'] += len(reference)
+        totals['config_faces'] += len(found)
+        totals['matched'] += matched
+
+    totals['speedup'] = (totals['exhaustive_seconds'] / totals['config_seconds']
+                         if totals['config_seconds'] else 0.0)
+    totals['recall'] = totals['matched'] / totals['exhaustive_faces'] if totals['exhaustive_faces'] else 1.0
+    print(f"\n{totals['images']} images: exhaustive {totals['exhaustive_seconds']:.2f}s, "
+          f"config {totals['config_seconds']:.2f}s ({totals['speedup']:.1f}x faster), "
+          f"recall {totals['recall']:.0%} ({totals['matched']}/{totals['exhaustive_faces']} faces, "
+          f"{totals['config_faces']} found)")
+    return totals
+
+def detection_config(cascade_names, passes=None, work_size=None, iou=0.3, merge=False):
+    """Return everything that determines find_faces output, as a detection cache config"""
+    passes = passes or list(DETECTION_PASSES)
+    return {
+        'detector': 'improved',
+        'cascades': {name: CASCADE_FILES[name] for name in cascade_names},
+        'passes': {name: DETECTION_PASSES[name] for name in passes},
+        'work_size': work_size,
+        'preprocess': PREPROCESS_SETTINGS,
+        'nms': {'iou': iou, 'merge': merge},
+        'filter': FILTER_SETTINGS,
+    }
+
+def extraction_stages(output_dir, cascade_names=None, every_n=None, fps=None, keyframes_only=False,
+                      cache_path=None, recrop=False, store=False, decode_threads=2, detect_threads=1,
+                      write_threads=2, **detection):
+    """
+    Return the decode -> detect -> filter -> write pipeline stages of the
+    improved extractor.
+
+    Each detection thread loads its own cascades. With cache_path, the raw
+    boxes and filter decisions of fresh detections are stored in the
+    DetectionCache (see face_pipeline.decode_stage). With store, crops go
+    to a face store in output_dir (see face_store).
+    """
+    key = config_key(detection_config(cascade_names or list(CASCADE_FILES), **detection))
+
+    def detect(job, state):
+        if 'faces' not in job:
+            if 'cascades' not in state:
+                state['cascades'] = load_cascades(cascade_names)
+            if 'timestamp' not in job:
+                job['log'].append(f"Processing: {job['name']}")
+            job['candidates'], job['raw'] = candidate_faces(job['image'], state['cascades'], **detection)
+        return job
+
+    def filter_faces(job, state):
+        if 'faces' not in job:
+            job['faces'] = accept_faces(job['image'], job['candidates'])
+            job['log'].extend("  Rejected non-face region" for _ in range(len(job['candidates']) - len(job['faces'])))
+            if 'cache' in job:
+                open_cache(cache_path).put(job['cache'], key, {
+                    'width': job['image'].shape[1], 'height': job['image'].shape[0],
+                    'raw': job.pop('raw'), 'candidates': job.pop('candidates')})
+        return job
+
+    def write(job, state):
+        indices = job.get('indices')
+        job['paths'] = save_face_crops(job.pop('image'), job['faces'], job['stem'], output_dir, verbose=False,
+                                       indices=indices, store=crop_record(job) if store else None)
+        for i, face in enumerate(job['faces']):
+            if indices is None or i in indices:
+                x, y, w, h = face['box']
+                job['log'].append(f"  Saved face {i + 1} ({w}x{h}, {face['source']}, {face['votes']} boxes)")
+        if 'timestamp' not in job:
+            job['log'].append(f"Total valid faces from {job['name']}: {len(job['paths'])}\n")
+        elif job['faces']:
+            job['log'].insert(0, f"Frame at {job['timestamp']:.2f}s of {job['name']}:")
+        return job
+
+    return [decode_stage(output_dir, key, cache_path, recrop, every_n, fps, keyframes_only, store, decode_threads),
+            Stage('detect', detect, detect_threads),
+            Stage('filter', filter_faces),
+            Stage('write', write, write_threads)]
+
+def extract_faces_improved(directory_path, output_dir, every_n=None, fps=None, keyframes_only=False,
+                           cascade_names=None, workers=1, cache_path=None, recrop=False, store=False,
+                           decode_threads=2, detect_threads=1, write_threads=2, queue_size=8, **detection):
+    """Advanced face extraction with profile detection and false positive filtering
+
+    Videos are sampled with every_n / fps / keyframes_only and decoded in
+    memory; their crops are named {stem}_t{milliseconds}_face_{i}.jpg.
+
+    cascade_names and detection (passes, work_size, iou, merge) select the
+    detection configuration (see find_faces); the defaults run the exhaustive
+    mode. Files stream through a pipeline with overlapped decode, detect,
+    filter and write threads (see face_pipeline.run_extraction), or through
+    a process pool with workers > 1, each worker loading the cascades once.
+
+    With cache_path, image detections are kept in a DetectionCache so that
+    repeat runs skip decode and detection for unchanged images and only
+    write missing crops (every crop with recrop). With store, crops are
+    appended to a packed face store in output_dir (see face_store).
+    """
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    items = run_extraction(list_media_files(directory_path), extraction_stages, workers, queue_size,
+                           output_dir=output_dir, cascade_names=cascade_names, every_n=every_n, fps=fps,
+                           keyframes_only=keyframes_only, cache_path=cache_path, recrop=recrop, store=store,
+                           decode_threads=decode_threads, detect_threads=detect_threads,
+                           write_threads=write_threads, **detection)
+    return collect_face_files(items)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Improved face extraction (front+profile)")
     parser.add_argument("directory", help="Path to directory containing images")
     parser.add_argument("--output", "-o", default="extracted_faces", help="Output directory")
+    add_sampling_arguments(parser)
+    add_workers_argument(parser)
+    add_cache_arguments(parser)
+    add_pipeline_arguments(parser)
+    add_store_argument(parser)
+    detection = parser.add_argument_group("detection")
+    detection.add_argument("--fast", action="store_true",
+                           help=f"Fast mode: cascades {','.join(FAST_PRESET['cascade_names'])}, "
+                                f"{','.join(FAST_PRESET['passes'])} pass, work size {FAST_PRESET['work_size']} "
+                                "(overridden by the options below)")
+    detection.add_argument("--work-size", type=int, default=None,
+                           help="Detect on a proxy downscaled to this longest side (default: full resolution)")
+    detection.add_argument("--cascades", default=None,
+                           help=f"Comma-separated cascades to run (default: all of {','.join(CASCADE_FILES)})")
+    detection.add_argument("--passes", default=None,
+                           help=f"Comma-separated parameter passes to run (default: all of {','.join(DETECTION_PASSES)})")
+    detection.add_argument("--iou", type=float, default=0.3,
+                           help="Overlap above which boxes are duplicates (default: 0.3)")
+    detection.add_argument("--merge", action="store_true",
+                           help="Merge duplicate boxes into their score-weighted mean instead of keeping the best one")
+    detection.add_argument("--compare", action="store_true",
+                           help="Report speed and recall of the chosen detection options against the exhaustive mode; saves nothing")
     
     args = parser.parse_args()
     
     if not os.path.isdir(args.directory):
         print(f"Error: {args.directory} is not a valid directory.")
         exit(1)
+
+    options = dict(FAST_PRESET) if args.fast else {}
+    options.update(iou=args.iou, merge=args.merge)
+    if args.work_size is not None:
+        options['work_size'] = args.work_size or None
+    if args.cascades:
+        options['cascade_names'] = [name.strip() for name in args.cascades.split(',') if name.strip()]
+    if args.passes:
+        options['passes'] = [name.strip() for name in args.passes.split(',') if name.strip()]
+    unknown = ([name for name in options.get('cascade_names', []) if name not in CASCADE_FILES] +
+               [name for name in options.get('passes', []) if name not in DETECTION_PASSES])
+    if unknown:
+        parser.error(f"unknown cascade or pass: {', '.join(unknown)}")
+
+    if args.compare:
+        compare_detection(args.directory, **options)
+        exit(0)
     
     print("Using improved face detection (frontal + profile + false positive filtering)")
-    face_files = extract_faces_improved(args.directory, args.output)
+    face_files = extract_faces_improved(args.directory, args.output, **sampling_options(args),
+                                        workers=workers_option(args), **cache_options(args),
+                                        **pipeline_options(args), store=args.store, **options)
     print(f"\n✅ Extracted {len(face_files)} high-quality faces to '{args.output}'")
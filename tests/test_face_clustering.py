@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from sklearn.cluster import DBSCAN
+
+import face_clustering
+
+def _encodings(seed, people=12, faces=600, dim=128):
+    """Clusters of unit-norm 128-d vectors (like face encodings) of varying spread, plus scattered noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(people, dim))
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    labels = rng.integers(0, people, faces)
+    spread = rng.uniform(0.01, 0.05, people)[labels]
+    X = centers[labels] + rng.normal(size=(faces, dim)) * spread[:, None]
+    noise = rng.normal(size=(faces // 10, dim))
+    return np.vstack([X, noise / np.linalg.norm(noise, axis=1, keepdims=True)]).astype(np.float32)
+
+@pytest.mark.parametrize("eps", [0.3, 0.5])
+@pytest.mark.parametrize("min_samples", [2, 5])
+def test_graph_dbscan_matches_euclidean_dbscan(eps, min_samples):
+    X = _encodings(seed=int(eps * 10) + min_samples)
+    expected = DBSCAN(eps=eps, min_samples=min_samples, metric='euclidean').fit(X).labels_
+    # Small chunks, so the graph is assembled from several neighbor queries
+    labels = face_clustering.dbscan(X, eps, min_samples, chunk_rows=97)
+    np.testing.assert_array_equal(labels, expected)
+    assert len(set(expected) - {-1}) > 1 and (expected == -1).any()
+
+def test_radius_neighbors_graph_includes_every_point():
+    X = _encodings(seed=0, faces=50)
+    graph = face_clustering.radius_neighbors_graph(X, 0.3, chunk_rows=7)
+    assert graph.shape == (len(X), len(X))
+    for row in range(len(X)):
+        assert row in graph.indices[graph.indptr[row]:graph.indptr[row + 1]]
+
+def test_dbscan_empty():
+    assert face_clustering.dbscan(np.empty((0, 128), np.float32), 0.5, 2).shape == (0,)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from improved_face_extractor import filter_likely_faces, is_likely_face
+
+def _test_image(rng, height=240, width=320):
+    """Noisy BGR image with skin-toned, textured patches, so boxes fall on both sides of every check."""
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    for _ in range(12):
+        x, y = rng.integers(0, width - 20), rng.integers(0, height - 20)
+        w, h = rng.integers(20, 120), rng.integers(20, 120)
+        patch = image[y:y + h, x:x + w]
+        # Skin hue / saturation with a wide brightness spread (contrast check)
+        patch[..., 0] = rng.integers(60, 120, patch.shape[:2])
+        patch[..., 1] = rng.integers(90, 170, patch.shape[:2])
+        patch[..., 2] = rng.integers(150, 256, patch.shape[:2])
+        if rng.random() < 0.3:
+            patch[...] = patch.mean(axis=(0, 1)).astype(np.uint8)  # flat: fails the contrast check
+    return image
+
+@pytest.mark.parametrize("seed", range(5))
+def test_filter_likely_faces_matches_is_likely_face(seed):
+    rng = np.random.default_rng(seed)
+    image = _test_image(rng)
+    height, width = image.shape[:2]
+    boxes = []
+    for _ in range(400):
+        x, y = rng.integers(0, width - 2), rng.integers(0, height - 2)
+        boxes.append((x, y, rng.integers(1, width - x + 1), rng.integers(1, height - y + 1)))
+
+    expected = [is_likely_face(image[y:y + h, x:x + w]) for x, y, w, h in boxes]
+    assert filter_likely_faces(image, boxes).tolist() == expected
+    assert any(expected)
+
+@pytest.mark.parametrize("min_area_ratio", [0.0, 0.3, 0.7])
+def test_filter_likely_faces_threshold(min_area_ratio):
+    rng = np.random.default_rng(42)
+    image = _test_image(rng)
+    boxes = [(x, y, s, s) for x in range(0, 280, 13) for y in range(0, 200, 11) for s in (8, 24, 40)]
+    expected = [is_likely_face(image[y:y + h, x:x + w], min_area_ratio) for x, y, w, h in boxes]
+    assert filter_likely_faces(image, boxes, min_area_ratio).tolist() == expected
+
+def test_filter_likely_faces_empty_boxes():
+    image = np.zeros((10, 10, 3), np.uint8)
+    assert filter_likely_faces(image, []).tolist() == []
+    assert filter_likely_faces(image, [(0, 0, 0, 5)]).tolist() == [False]
@@ -0,0 +1,145 @@
+import re
+import subprocess
+import threading
+from collections import deque
+from functools import lru_cache
+from queue import Queue
+
+import numpy as np
+
+from compress_videos import probe_video
+
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m4v'}
+
+_PTS_TIME = re.compile(r'\bpts_time:\s*(-?[\d.]+)')
+_FFMPEG_VERSION = re.compile(r'ffmpeg version n?(\d+)\.(\d+)')
+
+@lru_cache(maxsize=None)
+def _passthrough_args():
+    """
+    Return the ffmpeg options that keep every decoded frame and its timestamp.
+
+    -fps_mode replaced -vsync in FFmpeg 5.1; older releases only know -vsync.
+    Builds whose version cannot be parsed (git snapshots) are taken as new.
+    """
+    try:
+        output = subprocess.run(['ffmpeg', '-hide_banner', '-version'], check=True,
+                                capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        output = ''
+    match = _FFMPEG_VERSION.search(output)
+    if match and (int(match.group(1)), int(match.group(2))) < (5, 1):
+        return ['-vsync', 'passthrough']
+    return ['-fps_mode', 'passthrough']
+
+def _frame_size(video_path):
+    """Return the (width, height) ffmpeg will output, honoring display rotation."""
+    info = probe_video(video_path)
+    video = info['video']
+    if video is None:
+        raise ValueError(f"No video stream in {video_path}")
+    width, height = video['width'], video['height']
+    if video['rotation'] % 180:
+        # ffmpeg auto-rotates, so portrait phone videos come out transposed
+        width, height = height, width
+    return width, height
+
+def _sampling_args(every_n=None, fps=None, keyframes_only=False):
+    """Return (input options, filter chain) for a sampling mode."""
+    if keyframes_only:
+        return ['-skip_frame', 'nokey'], []
+    if fps:
+        return [], [f'fps={fps}']
+    if every_n and every_n > 1:
+        return [], [f'select=not(mod(n\\,{every_n}))']
+    return [], []
+
+def iter_video_frames(video_path, every_n=None, fps=None, keyframes_only=False, buffers=4):
+    """
+    Decode a video with ffmpeg and yield (timestamp_seconds, frame) pairs.
+
+    Frames arrive as raw BGR over a pipe and are read straight into a small
+    ring of preallocated NumPy buffers; nothing is written to disk. A reader
+    thread keeps up to buffers - 1 frames decoded ahead, so decoding overlaps
+    with whatever the caller does with each frame.
+
+    The yielded frame is a view into a reused buffer: it is only valid until
+    the next iteration, so copy it if it must be kept.
+
+    Args:
+        video_path (str): Video file to decode
+        every_n (int): Keep every Nth frame
+        fps (float): Resample to this many frames per second
+        keyframes_only (bool): Only decode keyframes (fastest)
+        buffers (int): Number of preallocated frame buffers
+    """
+    width, height = _frame_size(video_path)
+    input_args, filters = _sampling_args(every_n, fps, keyframes_only)
+    command = (['ffmpeg', '-nostdin', '-hide_banner', '-nostats'] + input_args +
+               ['-i', video_path, '-an', '-sn',
+                '-vf', ','.join(filters + ['showinfo'])] + _passthrough_args() +
+               ['-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1'])
+
+    frames = np.empty((max(2, buffers), height, width, 3), dtype=np.uint8)
+    free = Queue()
+    for index in range(len(frames)):
+        free.put(index)
+    ready = Queue()
+    timestamps = Queue()
+    stderr_tail = deque(maxlen=20)
+    stop = threading.Event()
+
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, bufsize=0)
+
+    def read_stderr():
+        for raw in process.stderr:
+            line = raw.decode('utf-8', 'replace')
+            match = _PTS_TIME.search(line) if 'showinfo' in line else None
+            if match:
+                timestamps.put(float(match.group(1)))
+            elif 'showinfo' not in line:
+                stderr_tail.append(line)
+        timestamps.put(None)
+
+    def read_frames():
+        try:
+            while not stop.is_set():
+                index = free.get()
+                if index is None:
+                    break
+                view = memoryview(frames[index]).cast('B')
+                filled = 0
+                while filled < len(view):
+                    count = process.stdout.readinto(view[filled:])
+                    if not count:
+                        break
+                    filled += count
+                if filled < len(view):
+                    break
+                ready.put(index)
+        finally:
+            ready.put(None)
+
+    stderr_reader = threading.Thread(target=read_stderr, daemon=True)
+    frame_reader = threading.Thread(target=read_frames, daemon=True)
+    stderr_reader.start()
+    frame_reader.start()
+    try:
+        while True:
+            index = ready.get()
+            if index is None:
+                break
+            timestamp = timestamps.get()
+            yield timestamp, frames[index]
+            free.put(index)
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed on {video_path}: {''.join(stderr_tail).strip()}")
+    finally:
+        stop.set()
+        free.put(None)
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        frame_reader.join()
+        stderr_reader.join()